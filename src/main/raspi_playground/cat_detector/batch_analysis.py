@@ -0,0 +1,358 @@
+"""
+Mine a directory of recorded videos for cat visits, using the same class rules as the buzzer.
+
+Each video is handled by one of a pool of worker processes, which decodes it (optionally only
+every Nth frame), runs the YOLO model on batches of frames and streams the matching detections
+to `.npz` chunks in the output directory as it goes. Chunks are written atomically and record the
+last frame they cover, so an interrupted run picks up where it stopped: finished videos are skipped
+and unfinished ones are resumed after their last chunk.
+
+When every video is done the chunks are merged into a single columnar `detections.npz`:
+    videos       (V,)   video file names
+    video        (N,)   index into `videos`
+    frame_index  (N,)   frame number in the video
+    timestamp    (N,)   seconds from the start of the video
+    class_id     (N,)
+    confidence   (N,)
+    boxes        (N, 4) xyxy in frame pixels
+
+Usage:
+    uv run src/main/raspi_playground/cat_detector/batch_analysis.py recordings/ analysis/ [every_nth] [workers] [model]
+"""
+from dataclasses import dataclass
+import multiprocessing
+import os
+import sys
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+import cv2
+import numpy as np
+import torch
+from ultralytics import YOLO
+
+from config import DEFAULT_DETECTION_CLASSES, DetectionClass
+
+import logging
+
+logging.basicConfig(level=logging.INFO)
+
+logger = logging.getLogger(__name__)
+
+
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mkv", ".mov", ".h264")
+COLUMNS = ("frame_index", "timestamp", "class_id", "confidence", "boxes")
+DONE_FILE = "done"
+MERGED_FILE = "detections.npz"
+
+
+@dataclass
+class VideoResult:
+    video: str
+    worker: str
+    frames: int
+    detections: int
+    seconds: float
+
+
+class DetectionColumns:
+    """
+    Column buffers for the detections of one chunk.
+    """
+
+    def __init__(self):
+        self.columns: Dict[str, List[np.ndarray]] = {column: [] for column in COLUMNS}
+        self.count = 0
+
+    def append(self, frame_index: int, timestamp: float, boxes: np.ndarray, confidences: np.ndarray, class_ids):
+        self.columns["frame_index"].append(np.full(len(boxes), frame_index, dtype=np.int64))
+        self.columns["timestamp"].append(np.full(len(boxes), timestamp, dtype=np.float64))
+        self.columns["class_id"].append(class_ids.astype(np.int64))
+        self.columns["confidence"].append(confidences.astype(np.float32))
+        self.columns["boxes"].append(boxes.astype(np.float32).reshape(-1, 4))
+        self.count += len(boxes)
+
+    def write(self, path: str, last_frame: int):
+        """
+        Write the chunk to `path` atomically, so a chunk on disk is always complete.
+        """
+        arrays = {
+            column: np.concatenate(values) if values else self.empty(column) for column, values in self.columns.items()
+        }
+        temp_path = f"{path}.tmp.npz"
+        np.savez(temp_path, last_frame=np.int64(last_frame), **arrays)
+        os.replace(temp_path, path)
+
+    @staticmethod
+    def empty(column: str) -> np.ndarray:
+        if column == "boxes":
+            return np.empty((0, 4), dtype=np.float32)
+        dtype = {"timestamp": np.float64, "confidence": np.float32}.get(column, np.int64)
+        return np.empty(0, dtype=dtype)
+
+
+class VideoAnalyzer:
+    """
+    Runs in each worker process: decodes videos, runs batched inference and writes detection chunks.
+    """
+
+    def __init__(
+        self,
+        model_path: str,
+        output_dir: str,
+        detection_classes: Sequence[DetectionClass] = DEFAULT_DETECTION_CLASSES,
+        every_nth: int = 1,
+        batch_size: int = 8,
+        chunk_frames: int = 2000,
+        imgsz: int = 640,
+    ):
+        self.model = YOLO(model_path, task="detect")
+        self.output_dir = output_dir
+        self.every_nth = every_nth
+        self.batch_size = batch_size
+        self.chunk_frames = chunk_frames
+        self.imgsz = imgsz
+
+        self.thresholds = self.class_thresholds(self.model.names, detection_classes)
+        self.min_confidence = min(self.thresholds.values())
+        self.class_ids = list(self.thresholds)
+        self._threshold_lookup = np.full(max(self.model.names) + 1, np.inf, dtype=np.float32)
+        for class_id, threshold in self.thresholds.items():
+            self._threshold_lookup[class_id] = threshold
+
+    @staticmethod
+    def class_thresholds(names: Dict[int, str], detection_classes: Sequence[DetectionClass]) -> Dict[int, float]:
+        """
+        Map the class ids of the detection classes the model knows to their confidence thresholds.
+        Raises ValueError if it knows none of them.
+        """
+        names_to_ids = {class_name: class_id for class_id, class_name in names.items()}
+        thresholds = {
+            names_to_ids[detection_class.name]: detection_class.confidence
+            for detection_class in detection_classes
+            if detection_class.name in names_to_ids
+        }
+        if not thresholds:
+            raise ValueError(
+                f"The model knows none of the detection classes {[c.name for c in detection_classes]}, "
+                f"its classes are {sorted(names.values())}"
+            )
+        return thresholds
+
+    def analyze(self, video_path: str) -> VideoResult:
+        """
+        Analyze a video, resuming after the last chunk written for it by an earlier run.
+        """
+        worker = multiprocessing.current_process().name
+        video = os.path.basename(video_path)
+        video_dir = os.path.join(self.output_dir, video)
+        os.makedirs(video_dir, exist_ok=True)
+        chunk_index, start_frame = self.resume_point(video_dir)
+
+        capture = cv2.VideoCapture(video_path)
+        if not capture.isOpened():
+            logger.warning(f"[{worker}] Could not open {video_path}, skipping it")
+            return VideoResult(video, worker, 0, 0, 0.0)
+        fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+        if start_frame > 0:
+            logger.info(f"[{worker}] Resuming {video} at frame {start_frame}")
+            capture = self.seek(capture, video_path, start_frame)
+
+        start = time.perf_counter()
+        frames = detections = 0
+        chunk = DetectionColumns()
+        chunk_start = start_frame
+        batch: List[np.ndarray] = []
+        batch_frames: List[int] = []
+        frame_index = start_frame - 1
+
+        while True:
+            # grab() skips decoding the frames which aren't sampled
+            if not capture.grab():
+                break
+            frame_index += 1
+            if frame_index % self.every_nth != 0:
+                continue
+            ok, frame = capture.retrieve()
+            if not ok:
+                break
+            batch.append(frame)
+            batch_frames.append(frame_index)
+
+            if len(batch) == self.batch_size:
+                self.predict(batch, batch_frames, fps, chunk)
+                frames += len(batch)
+                batch, batch_frames = [], []
+            if frame_index - chunk_start + 1 >= self.chunk_frames and not batch:
+                detections += chunk.count
+                chunk.write(self.chunk_path(video_dir, chunk_index), last_frame=frame_index)
+                chunk_index, chunk_start, chunk = chunk_index + 1, frame_index + 1, DetectionColumns()
+                elapsed = time.perf_counter() - start
+                logger.info(f"[{worker}] {video}: frame {frame_index}, {frames / elapsed:.1f} FPS")
+        capture.release()
+
+        if batch:
+            self.predict(batch, batch_frames, fps, chunk)
+            frames += len(batch)
+        detections += chunk.count
+        chunk.write(self.chunk_path(video_dir, chunk_index), last_frame=frame_index)
+        # Only now is the video complete, a crash before this resumes from the last chunk
+        open(os.path.join(video_dir, DONE_FILE), "w").close()
+
+        seconds = time.perf_counter() - start
+        logger.info(
+            f"[{worker}] Finished {video}: {frames} frames, {detections} detections, "
+            f"{frames / seconds if seconds else 0:.1f} FPS"
+        )
+        return VideoResult(video, worker, frames, detections, seconds)
+
+    def predict(self, frames: List[np.ndarray], frame_indices: List[int], fps: float, chunk: DetectionColumns):
+        """
+        Run the model on a batch of frames and add the detections which pass the class rules to the chunk.
+        """
+        results = self.model.predict(
+            frames, imgsz=self.imgsz, conf=self.min_confidence, classes=self.class_ids, verbose=False
+        )
+        for frame_index, result in zip(frame_indices, results):
+            boxes = result.boxes
+            class_ids = boxes.cls.cpu().numpy().astype(np.int64)
+            confidences = boxes.conf.cpu().numpy()
+            keep = confidences >= self._threshold_lookup[class_ids]
+            if keep.any():
+                chunk.append(
+                    frame_index, frame_index / fps, boxes.xyxy.cpu().numpy()[keep], confidences[keep], class_ids[keep]
+                )
+
+    @staticmethod
+    def seek(capture: cv2.VideoCapture, video_path: str, frame_index: int) -> cv2.VideoCapture:
+        """
+        Move `capture` to `frame_index`. Streams without an index (e.g. raw .h264) can fail to seek or land
+        on the wrong frame, those are reopened and read up to the frame instead. Returns the capture to use.
+        """
+        if capture.set(cv2.CAP_PROP_POS_FRAMES, frame_index):
+            position = int(capture.get(cv2.CAP_PROP_POS_FRAMES))
+            if position == frame_index:
+                return capture
+            logger.warning(f"Seeking {video_path} to frame {frame_index} landed on frame {position}")
+        logger.info(f"Reading {video_path} up to frame {frame_index} instead of seeking")
+        capture.release()
+        capture = cv2.VideoCapture(video_path)
+        for _ in range(frame_index):
+            if not capture.grab():
+                break
+        return capture
+
+    @staticmethod
+    def chunk_path(video_dir: str, chunk_index: int) -> str:
+        return os.path.join(video_dir, f"chunk_{chunk_index:06d}.npz")
+
+    @staticmethod
+    def chunk_paths(video_dir: str) -> List[str]:
+        return sorted(
+            os.path.join(video_dir, file_name)
+            for file_name in os.listdir(video_dir)
+            if file_name.startswith("chunk_") and file_name.endswith(".npz") and ".tmp" not in file_name
+        )
+
+    @staticmethod
+    def resume_point(video_dir: str) -> Tuple[int, int]:
+        """
+        Return the index of the next chunk to write and the first frame it should cover.
+        """
+        chunk_paths = VideoAnalyzer.chunk_paths(video_dir)
+        if not chunk_paths:
+            return 0, 0
+        with np.load(chunk_paths[-1]) as chunk:
+            return len(chunk_paths), int(chunk["last_frame"]) + 1
+
+
+# One analyzer per worker process, created by the pool initializer
+_analyzer: Optional[VideoAnalyzer] = None
+
+
+def _init_worker(torch_threads: int, model_path: str, output_dir: str, analyzer_kwargs: Dict):
+    global _analyzer
+    # Split the cores between the workers instead of every worker using all of them
+    torch.set_num_threads(torch_threads)
+    _analyzer = VideoAnalyzer(model_path, output_dir, **analyzer_kwargs)
+
+
+def _analyze(video_path: str) -> VideoResult:
+    return _analyzer.analyze(video_path)
+
+
+def merge_chunks(output_dir: str, videos: Sequence[str]) -> str:
+    """
+    Merge the chunks of every video into a single columnar `detections.npz` in `output_dir`.
+    """
+    columns: Dict[str, List[np.ndarray]] = {column: [] for column in COLUMNS}
+    video_column: List[np.ndarray] = []
+    for video_index, video in enumerate(videos):
+        for chunk_path in VideoAnalyzer.chunk_paths(os.path.join(output_dir, video)):
+            with np.load(chunk_path) as chunk:
+                for column in COLUMNS:
+                    columns[column].append(chunk[column])
+                video_column.append(np.full(len(chunk["frame_index"]), video_index, dtype=np.int64))
+
+    path = os.path.join(output_dir, MERGED_FILE)
+    arrays = {
+        column: np.concatenate(values) if values else DetectionColumns.empty(column)
+        for column, values in columns.items()
+    }
+    video_indices = np.concatenate(video_column) if video_column else np.empty(0, dtype=np.int64)
+    np.savez(path, videos=np.array(videos), video=video_indices, **arrays)
+    logger.info(f"Wrote {len(video_indices)} detections from {len(videos)} videos to {path}")
+    return path
+
+
+def analyze_directory(
+    videos_dir: str,
+    output_dir: str,
+    every_nth: int = 1,
+    workers: Optional[int] = None,
+    model_path: str = ".models/yolo11n.pt",
+    **analyzer_kwargs,
+) -> str:
+    """
+    Analyze every video in `videos_dir` with a pool of worker processes, skipping the ones finished
+    by an earlier run. Returns the path of the merged detections.
+    """
+    videos = sorted(file_name for file_name in os.listdir(videos_dir) if file_name.lower().endswith(VIDEO_EXTENSIONS))
+    os.makedirs(output_dir, exist_ok=True)
+    pending = [
+        os.path.join(videos_dir, video)
+        for video in videos
+        if not os.path.exists(os.path.join(output_dir, video, DONE_FILE))
+    ]
+    logger.info(f"{len(videos)} videos in {videos_dir}, {len(videos) - len(pending)} already analyzed")
+
+    if pending:
+        # Check the classes here, an exception in the workers' initializer makes the pool respawn them forever
+        VideoAnalyzer.class_thresholds(
+            YOLO(model_path, task="detect").names,
+            analyzer_kwargs.get("detection_classes", DEFAULT_DETECTION_CLASSES),
+        )
+        workers = min(workers or os.cpu_count() or 1, len(pending))
+        torch_threads = max(1, (os.cpu_count() or 1) // workers)
+        init_args = (torch_threads, model_path, output_dir, dict(analyzer_kwargs, every_nth=every_nth))
+        # torch doesn't survive being forked once it has started its thread pools
+        context = multiprocessing.get_context("spawn")
+        worker_stats: Dict[str, List[float]] = {}
+        with context.Pool(workers, initializer=_init_worker, initargs=init_args) as pool:
+            for result in pool.imap_unordered(_analyze, pending):
+                frames, seconds = worker_stats.setdefault(result.worker, [0, 0.0])
+                worker_stats[result.worker] = [frames + result.frames, seconds + result.seconds]
+
+        for worker, (frames, seconds) in sorted(worker_stats.items()):
+            logger.info(f"{worker}: {frames} frames in {seconds:.1f}s, {frames / seconds if seconds else 0:.1f} FPS")
+
+    return merge_chunks(output_dir, videos)
+
+
+if __name__ == "__main__":
+    analyze_directory(
+        sys.argv[1],
+        sys.argv[2],
+        every_nth=int(sys.argv[3]) if len(sys.argv) > 3 else 1,
+        workers=int(sys.argv[4]) if len(sys.argv) > 4 else None,
+        model_path=sys.argv[5] if len(sys.argv) > 5 else ".models/yolo11n.pt",
+    )
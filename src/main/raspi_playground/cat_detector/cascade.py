@@ -0,0 +1,233 @@
+"""
+A two-stage model cascade: a small, low resolution "gate" model runs on every frame, and a larger
+"confirm" model (e.g. yolo11s) only runs on the frames where the gate sees a candidate cat.
+
+Most frames have no cat in them, so on average a frame costs little more than the gate while the
+detections which matter come from the bigger model. The confirm model runs either on the whole
+frame or on crops around the gate's candidates ("crop" mode), which keeps small, distant cats at a
+usable resolution.
+
+Both stages are ncnn exports run with `NcnnDetector`. Use the cascade as the engine's model:
+    engine = DetectionEngine(model=CascadeDetector.load("yolo11n", "yolo11s"))
+"""
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Tuple
+import numpy as np
+
+from detection_engine import DetectionEngine
+from ncnn_backend import NcnnDetector, non_max_suppression
+from preprocessing import Letterbox
+from tracing import tracer
+
+import logging
+
+logging.basicConfig(level=logging.INFO)
+
+logger = logging.getLogger(__name__)
+
+
+CONFIRM_MODES = ("frame", "crop")
+# Crop sides are rounded up to a multiple of this, so only a few letterbox sizes are ever needed
+CROP_STEP = 64
+# Each letterbox holds a few MB of buffers: the gate's, the full frame confirm's and a crop size or two
+MAX_CACHED_LETTERBOXES = 4
+
+
+@dataclass
+class CascadeStats:
+    frames: int = 0
+    # Frames on which the confirm model ran, and the number of times it ran (once per crop in "crop" mode)
+    confirmed_frames: int = 0
+    confirm_runs: int = 0
+    gate_ms: float = 0.0
+    confirm_ms: float = 0.0
+
+    @property
+    def confirm_rate(self) -> float:
+        return self.confirmed_frames / self.frames if self.frames else 0.0
+
+    @property
+    def ms_per_frame(self) -> float:
+        return (self.gate_ms + self.confirm_ms) / self.frames if self.frames else 0.0
+
+    def __str__(self) -> str:
+        gate_ms = self.gate_ms / self.frames if self.frames else 0.0
+        confirm_ms = self.confirm_ms / self.confirm_runs if self.confirm_runs else 0.0
+        return (
+            f"{self.frames} frames, confirm ran on {self.confirm_rate:.1%} of them ({self.confirm_runs} runs), "
+            f"gate {gate_ms:.1f}ms/frame, confirm {confirm_ms:.1f}ms/run, average {self.ms_per_frame:.1f}ms/frame"
+        )
+
+
+class CascadeDetector:
+    """
+    Run the gate model on every frame and the confirm model only when the gate finds one of `candidate_classes`.
+
+    Detections of the candidate classes come from the confirm model, everything else from the gate.
+    The gate should use a low confidence threshold: it only decides whether the confirm model runs,
+    a missed candidate can't be recovered but a false one only costs a confirm run.
+    """
+
+    # Tells the engine to pass the camera frame itself instead of a letterboxed input
+    reads_frames = True
+
+    def __init__(
+        self,
+        gate: NcnnDetector,
+        confirm: NcnnDetector,
+        candidate_classes: Iterable[str] = ("cat", "teddy bear"),
+        confirm_mode: str = "crop",
+        crop_margin: float = 0.25,
+        max_crops: int = 3,
+        log_interval: int = 300,
+    ):
+        if confirm_mode not in CONFIRM_MODES:
+            raise ValueError(f"Unknown confirm mode '{confirm_mode}', expected one of {CONFIRM_MODES}")
+        if gate.names != confirm.names:
+            raise ValueError("The gate and confirm models must be trained on the same classes")
+
+        self.gate = gate
+        self.confirm = confirm
+        self.names = confirm.names
+        self.imgsz = confirm.imgsz
+        names_to_ids = {name: class_id for class_id, name in self.names.items()}
+        unknown = [name for name in candidate_classes if name not in names_to_ids]
+        if unknown:
+            raise ValueError(f"Unknown candidate classes {unknown}")
+        self.candidate_ids = np.array([names_to_ids[name] for name in candidate_classes], dtype=np.int64)
+        self.confirm_mode = confirm_mode
+        self.crop_margin = crop_margin
+        # More candidates than this are confirmed on the whole frame, one run is cheaper than many crops
+        self.max_crops = max_crops
+        self.log_interval = log_interval
+        self.stats = CascadeStats()
+        self._letterboxes: Dict[Tuple[Tuple[int, ...], int], Letterbox] = {}
+
+    @classmethod
+    def load(
+        cls,
+        gate_model: str = "yolo11n",
+        confirm_model: str = "yolo11s",
+        gate_imgsz: int = 320,
+        gate_conf_threshold: float = 0.15,
+        low_memory: bool = False,
+        **kwargs,
+    ) -> "CascadeDetector":
+        """
+        Load (exporting them first if needed) the ncnn versions of the gate model at `gate_imgsz` and the confirm model.
+        `low_memory` applies the same export and ncnn settings as `DetectionEngine(low_memory=True)`.
+        """
+        gate = NcnnDetector(
+            DetectionEngine.export_ncnn_model(gate_model, imgsz=gate_imgsz, low_memory=low_memory),
+            conf_threshold=gate_conf_threshold,
+            low_memory=low_memory,
+        )
+        confirm = NcnnDetector(
+            DetectionEngine.export_ncnn_model(confirm_model, low_memory=low_memory), low_memory=low_memory
+        )
+        return cls(gate, confirm, **kwargs)
+
+    def detect_frame(self, frame: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, Dict[str, float]]:
+        """
+        Run the cascade on a BGR frame. Returns (boxes, confidences, class_ids, speed) with xyxy boxes in
+        frame coordinates and the time spent in each stage in milliseconds, with their total as "inference".
+        """
+        start = tracer.now()
+        with tracer.span("gate"):
+            boxes, confidences, class_ids = self._detect(self.gate, frame)
+        gate_done = tracer.now()
+        speed = {"gate": (gate_done - start) / 1e6}
+
+        is_candidate = np.isin(class_ids, self.candidate_ids)
+        if is_candidate.any():
+            with tracer.span("confirm", mode=self.confirm_mode, candidates=int(is_candidate.sum())):
+                confirmed = self._confirm(frame, boxes[is_candidate])
+            speed["confirm"] = (tracer.now() - gate_done) / 1e6
+            # Candidates are replaced by what the confirm model found, the other classes stay as the gate saw them
+            boxes = np.concatenate([boxes[~is_candidate], confirmed[0]])
+            confidences = np.concatenate([confidences[~is_candidate], confirmed[1]])
+            class_ids = np.concatenate([class_ids[~is_candidate], confirmed[2]])
+
+        speed["inference"] = speed["gate"] + speed.get("confirm", 0.0)
+        self._update_stats(speed)
+        return boxes, confidences, class_ids, speed
+
+    def _confirm(self, frame: np.ndarray, candidate_boxes: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Run the confirm model on the frame or on crops around the candidates, keeping only candidate classes.
+        """
+        if self.confirm_mode == "frame" or len(candidate_boxes) > self.max_crops:
+            self.stats.confirm_runs += 1
+            return self._candidates_only(*self._detect(self.confirm, frame))
+
+        all_boxes: List[np.ndarray] = []
+        all_confidences: List[np.ndarray] = []
+        all_class_ids: List[np.ndarray] = []
+        for left, top, right, bottom in self._crop_regions(frame.shape, candidate_boxes):
+            self.stats.confirm_runs += 1
+            boxes, confidences, class_ids = self._candidates_only(
+                *self._detect(self.confirm, frame[top:bottom, left:right])
+            )
+            boxes += np.array([left, top, left, top], dtype=np.float32)
+            all_boxes.append(boxes)
+            all_confidences.append(confidences)
+            all_class_ids.append(class_ids)
+
+        boxes = np.concatenate(all_boxes)
+        confidences = np.concatenate(all_confidences)
+        class_ids = np.concatenate(all_class_ids)
+        if len(all_boxes) > 1:
+            # Overlapping crops find the same cat more than once
+            keep = non_max_suppression(boxes, confidences, class_ids, self.confirm.iou_threshold)
+            boxes, confidences, class_ids = boxes[keep], confidences[keep], class_ids[keep]
+        return boxes, confidences, class_ids
+
+    def _crop_regions(self, frame_shape: Tuple[int, ...], boxes: np.ndarray) -> List[Tuple[int, int, int, int]]:
+        """
+        Square (left, top, right, bottom) regions around each box plus `crop_margin`, kept inside the frame.
+        """
+        height, width = frame_shape[:2]
+        regions = []
+        for x1, y1, x2, y2 in boxes:
+            side = max(x2 - x1, y2 - y1) * (1 + 2 * self.crop_margin)
+            side = int(np.ceil(side / CROP_STEP) * CROP_STEP)
+            crop_width, crop_height = min(side, width), min(side, height)
+            left = int(np.clip((x1 + x2 - crop_width) / 2, 0, width - crop_width))
+            top = int(np.clip((y1 + y2 - crop_height) / 2, 0, height - crop_height))
+            regions.append((left, top, left + crop_width, top + crop_height))
+        return regions
+
+    def _candidates_only(
+        self, boxes: np.ndarray, confidences: np.ndarray, class_ids: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        keep = np.isin(class_ids, self.candidate_ids)
+        return boxes[keep], confidences[keep], class_ids[keep]
+
+    def _detect(self, detector: NcnnDetector, image: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Letterbox an image for `detector` and return its detections in image coordinates.
+        """
+        letterbox = self._letterbox(image.shape, detector.imgsz)
+        boxes, confidences, class_ids, _ = detector.detect(letterbox(image))
+        letterbox.scale_boxes(boxes)
+        return boxes, confidences, class_ids
+
+    def _letterbox(self, shape: Tuple[int, ...], imgsz: int) -> Letterbox:
+        key = (tuple(shape), imgsz)
+        # Least recently used first, so the gate's letterbox (used every frame) is never the one evicted
+        letterbox = self._letterboxes.pop(key, None)
+        if letterbox is None:
+            if len(self._letterboxes) >= MAX_CACHED_LETTERBOXES:
+                del self._letterboxes[next(iter(self._letterboxes))]
+            letterbox = Letterbox(shape, imgsz=imgsz)
+        self._letterboxes[key] = letterbox
+        return letterbox
+
+    def _update_stats(self, speed: Dict[str, float]):
+        self.stats.frames += 1
+        self.stats.gate_ms += speed["gate"]
+        if "confirm" in speed:
+            self.stats.confirmed_frames += 1
+            self.stats.confirm_ms += speed["confirm"]
+        if self.log_interval and self.stats.frames % self.log_interval == 0:
+            logger.info(f"Cascade: {self.stats}")
@@ -4,16 +4,22 @@ This script uses a pan-tilt servo mount with the picamera to follow a cat (or an
 The pan-tilt mount is controlled by two SG90 servos connected to a PCA9685 board.
 The camera feed uses YOLO to detect the cat and adjust the pan and tilt angles accordingly.
 """
-from dataclasses import dataclass
-from typing import List, Optional
-import cv2
-import os
-from time import sleep
-from gpiozero import Buzzer, RGBLED
+from typing import TYPE_CHECKING, Dict, List, Optional, Set
 from colorzero import Color
-from picamera2 import Picamera2
-from ultralytics import YOLO
-from ultralytics.engine.results import Results, Boxes
+
+from config import FollowerConfig, RuntimeConfig, ServoConfig
+from detection_engine import (
+    DetectionClass,
+    DetectionEngine,
+    DetectionSubscriber,
+    Detections,
+    PreviewSubscriber,
+)
+from tracing import tracer
+
+if TYPE_CHECKING:
+    # Only imported to drive the real PCA9685, so the runner also works with simulated servos
+    from adafruit_servokit import ServoKit
 
 import logging
 
@@ -22,201 +28,150 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-MODELS_DIR = ".models/"
-
-
-class StopDetectionLoop(Exception):
-    """Custom exception to stop the detection loop."""
-
-    pass
-
-
-@dataclass
-class DetectionClass:
-    name: str
-    confidence: float
-    color: Optional[Color] = None
-    buzz: bool = True
-
-
-# class CatBuzzerDeviceHandler():
-#     """
-#     Class which allows for async handling of buzzer and LED actions.
+class CatFollowerRunner(DetectionSubscriber):
+    """
+    Point the pan-tilt mount at the most confident detection of the followed classes.
+    """
 
-#     The class will maintain the active state of the buzzer and LED
-#     and allow for state updates from another thread.
-#     """
+    name = "follower"
 
-#     def __init__(self, buzzer: Buzzer, rgb_led: RGBLED):
-#         self.buzzer = buzzer
-#         self.rgb_led = rgb_led
-
-
-#     def set_buzzer(self, on: bool, duration_ms: int = 100):
-#         if on:
-#             self.buzzer.on()
-#             sleep(duration_ms / 1000)
-#             self.buzzer.off()
-#         else:
-#             self.buzzer.off()
-
-
-class CatFollowerRunner:
-
-    IDLE_LED_COLOR = Color("green")
     DEFAULT_CLASSES = [
         DetectionClass("cat", 0.5, Color("red")),
         DetectionClass("teddy bear", 0.5, Color("blue")),
-        DetectionClass("person", 0.8, buzz=False),
     ]
 
-    picam: Picamera2
-    show_preview: bool
-    model: YOLO
-    buzzer: Buzzer
-    rgb_led: RGBLED
+    # Calibrated SG90 Servo Ranges, see servos/pan_tilt_servo.py
+    PAN_CHANNEL = 0
+    PAN_PULSE_RANGE = (400, 2680)
+    PAN_ACTUATION_RANGE = 180
+    TILT_CHANNEL = 1
+    TILT_PULSE_RANGE = (1550, 2500)
+    TILT_ACTUATION_RANGE = 90
+
+    # Degrees to move per frame for a target at the very edge of the frame
+    PAN_GAIN = 10.0
+    TILT_GAIN = 8.0
+    # Ignore offsets smaller than this fraction of the frame, so the mount doesn't jitter
+    DEADBAND = 0.05
+
+    detection_classes: List[DetectionClass]
+    follower_config: FollowerConfig
+    servos: "ServoKit"
 
     def __init__(
         self,
-        show_preview: bool = True,
         detection_classes: List[DetectionClass] = DEFAULT_CLASSES,
-        buzzer_pin: int = 17,
-        led_pins: tuple = (5, 6, 13),
-        common_cathode: bool = False,
+        servos: Optional["ServoKit"] = None,
     ):
-        # Set up the camera with Picam
-        logger.info("Setting up camera...")
-        self.show_preview = show_preview
-        self.picam = self.setup_camera()
-        if self.show_preview:
-            self.picam.configure("preview")
-
-        # Load a YOLO11n PyTorch model
-        logger.info("Setting up detection model...")
-        self.model = self.load_yolo_model()
-
-        self.buzzer = Buzzer(buzzer_pin)
-        self.rgb_led = RGBLED(*led_pins, active_high=common_cathode)
-
-    def main(self):
-        self.picam.start()
-        self.rgb_led.color = self.IDLE_LED_COLOR
-
-        try:
-            while True:
-                self.run_loop()
-        except StopDetectionLoop as e:
-            logger.info("Stopping detection loop...", e)
-
-        # Close all windows
-        cv2.destroyAllWindows()
-        self.picam.stop()
-        self.rgb_led.off()
-        self.buzzer.off()
-
-    def run_loop(self) -> bool:
+        self.detection_classes = detection_classes
+        # Thresholds for every class the config may ask to follow
+        self.available_classes = list(detection_classes)
+        self.follower_config = FollowerConfig(
+            classes=tuple(dc.name for dc in detection_classes),
+            pan=ServoConfig(self.PAN_CHANNEL, self.PAN_PULSE_RANGE, self.PAN_ACTUATION_RANGE),
+            tilt=ServoConfig(self.TILT_CHANNEL, self.TILT_PULSE_RANGE, self.TILT_ACTUATION_RANGE),
+            pan_gain=self.PAN_GAIN,
+            tilt_gain=self.TILT_GAIN,
+            deadband=self.DEADBAND,
+        )
+        # Restored when their section is removed from the config
+        self._defaults = RuntimeConfig(classes=tuple(detection_classes), follower=self.follower_config)
+        if servos is None:
+            from adafruit_servokit import ServoKit
+
+            servos = ServoKit(channels=16)
+        self.servos = servos
+        self.pan_servo = self.setup_servo(self.follower_config.pan)
+        self.tilt_servo = self.setup_servo(self.follower_config.tilt)
+
+        # Start the pan in the middle and the tilt half way up
+        self.pan_angle = self.follower_config.pan.actuation_range / 2
+        self.tilt_angle = self.follower_config.tilt.actuation_range / 2
+        self._ids_to_detection_classes: Dict[int, DetectionClass] = {}
+
+    def setup(self, engine: DetectionEngine):
+        self.engine = engine
+        self._ids_to_detection_classes = engine.class_map(self.detection_classes)
+        self.pan_servo.angle = self.pan_angle
+        self.tilt_servo.angle = self.tilt_angle
+
+    def reconfigure(self, config: RuntimeConfig, changed: Set[str]):
         """
-        Run the main loop for capturing frames and processing detections.
+        Apply new class thresholds and follower settings, recalibrating only the servos which changed.
+        Removed sections go back to the constructor's settings.
         """
-        # Capture a frame from the camera
-        frame = self.picam.capture_array()
-
-        # Run YOLO model on the captured frame and store the results
-        # We pass a single frame, so we get a list with one Results object
-        results: List[Results] = self.model.predict(frame, verbose=False)[0]
-
-        if self.show_preview:
-            self.update_preview(results)
-
-        self.process_boxes(results.boxes)
-
-    def update_preview(self, results: List[Results]):
+        if "classes" in changed:
+            self.available_classes = list(self._defaults.classes if config.classes is None else config.classes)
+
+        if "follower" in changed:
+            previous, self.follower_config = self.follower_config, config.follower or self._defaults.follower
+            if self.follower_config.pan != previous.pan:
+                self.pan_servo = self.replace_servo(self.pan_servo, previous.pan, self.follower_config.pan)
+                self.pan_angle = self.clamp(self.pan_angle, self.follower_config.pan.actuation_range)
+                self.pan_servo.angle = self.pan_angle
+            if self.follower_config.tilt != previous.tilt:
+                self.tilt_servo = self.replace_servo(self.tilt_servo, previous.tilt, self.follower_config.tilt)
+                self.tilt_angle = self.clamp(self.tilt_angle, self.follower_config.tilt.actuation_range)
+                self.tilt_servo.angle = self.tilt_angle
+
+        if changed & {"classes", "follower"}:
+            self.detection_classes = [dc for dc in self.available_classes if dc.name in self.follower_config.classes]
+            self._ids_to_detection_classes = self.engine.class_map(self.detection_classes)
+
+    def on_detections(self, detections: Detections):
         """
-        Handle post-prediction actions such as buzzing and LED color changes.
+        Move the servos towards the center of the most confident matching box.
         """
-        # Output the visual detection data, we will draw this on our camera preview window
-        annotated_frame = results[0].plot()
-
-        # Get inference time
-        inference_time = results[0].speed["inference"]
-        fps = 1000 / inference_time  # Convert to milliseconds
-        text = f"FPS: {fps:.1f}"
-
-        # Define font and position
-        font = cv2.FONT_HERSHEY_SCRIPT_COMPLEX
-        text_size = cv2.getTextSize(text, font, 1, 2)[0]
-        text_x = annotated_frame.shape[1] - text_size[0] - 10  # 10 pixels from the right
-        text_y = text_size[1] + 10  # 10 pixels from the top
-
-        # Draw the text on the annotated frame
-        cv2.putText(annotated_frame, text, (text_x, text_y), font, 1, (255, 255, 255), 2, cv2.LINE_AA)
-
-        # Display the resulting frame
-        cv2.imshow("Camera", annotated_frame)
-
-        # Stop execution if 'q' is pressed
-        if cv2.waitKey(1) == ord("q"):
-            raise StopDetectionLoop("'q' pressed, stopping detection loop.")
-
-    def process_boxes(self, boxes: List[Boxes]):
+        target = max(detections.matches(self._ids_to_detection_classes), key=lambda match: match[2], default=None)
+        if target is None:
+            return
+
+        _, box, _ = target
+        height, width = detections.frame_shape[:2]
+        # Offset of the box center from the frame center, in [-0.5, 0.5]
+        x_offset = (box[0] + box[2]) / 2 / width - 0.5
+        y_offset = (box[1] + box[3]) / 2 / height - 0.5
+
+        follower_config = self.follower_config
+        if abs(x_offset) > follower_config.deadband:
+            self.pan_angle = self.clamp(
+                self.pan_angle - 2 * x_offset * follower_config.pan_gain, follower_config.pan.actuation_range
+            )
+            with tracer.span("pan_servo", angle=self.pan_angle):
+                self.pan_servo.angle = self.pan_angle
+        if abs(y_offset) > follower_config.deadband:
+            self.tilt_angle = self.clamp(
+                self.tilt_angle - 2 * y_offset * follower_config.tilt_gain, follower_config.tilt.actuation_range
+            )
+            with tracer.span("tilt_servo", angle=self.tilt_angle):
+                self.tilt_servo.angle = self.tilt_angle
+
+    def close(self):
+        # Release the servos
+        self.pan_servo.angle = None
+        self.tilt_servo.angle = None
+
+    def setup_servo(self, servo_config: ServoConfig):
+        servo = self.servos.servo[servo_config.channel]
+        servo.set_pulse_width_range(*servo_config.pulse_range)
+        servo.actuation_range = servo_config.actuation_range
+        return servo
+
+    def replace_servo(self, servo, previous: ServoConfig, servo_config: ServoConfig):
         """
-        Process the detected boxes to determine actions.
+        Recalibrate a servo, releasing the old one first if it moved to another channel.
         """
-        if not hasattr(self, "_ids_to_detection_classes"):
-            names_to_ids = {class_name: class_id for class_id, class_name in self.model.names.items()}
-            self._ids_to_detection_classes = {
-                names_to_ids[dc.name]: dc for dc in self.DEFAULT_CLASSES if dc.name in names_to_ids
-            }
-
-        for box in boxes:
-            class_id = int(box.cls[0])
-            if class_id in self._ids_to_detection_classes:
-                detection_class = self._ids_to_detection_classes[class_id]
-                if detection_class.buzz:
-                    self.buzzer.on()
-                    sleep(0.1)
-                    self.buzzer.off()
-                if detection_class.color:
-                    self.rgb_led.color = detection_class.color
+        if servo_config.channel != previous.channel:
+            servo.angle = None
+        return self.setup_servo(servo_config)
 
     @staticmethod
-    def setup_camera() -> Picamera2:
-        """
-        Set up the Picamera2 camera with the desired configuration.
-        Once returned, the camera still needs to be started with `picam2.start()`.
-        """
-        # Set up the camera with Picam
-        picam2 = Picamera2()
-        picam2.preview_configuration.main.size = (1280, 1280)
-        picam2.preview_configuration.main.format = "RGB888"
-        picam2.preview_configuration.align()
-        return picam2
-
-    @staticmethod
-    def load_yolo_model(model_name: str = "yolo11n") -> YOLO:
-        """
-        Load the YOLO model with the specified name.
-        If the NCNN version of the model does not exist, it will be downloaded and
-        created from the PyTorch version.
-        """
-        # Check if the ncnn model already exists
-        if not os.path.exists(os.path.join(MODELS_DIR, f"{model_name}_ncnn_model")):
-            logger.info("NCNN model not found, downloading PyTorch model...")
-            # Load a YOLO11n PyTorch model
-            pt_model = YOLO(os.path.join(MODELS_DIR, f"{model_name}.pt"))
-
-            # Export the model to NCNN format
-            logger.info("Exporting model to NCNN format...")
-            pt_model.export(format="ncnn")  # creates '{model_name}_ncnn_model'
-
-            logger.info("NCNN model exported successfully.")
-
-        logger.info("Loading NCNN model...")  # Use logger instead of
-        # Load the exported NCNN model
-        model = YOLO(os.path.join(MODELS_DIR, f"{model_name}_ncnn_model"))
-        return model
+    def clamp(angle: float, actuation_range: float) -> float:
+        return min(max(angle, 0), actuation_range)
 
 
 if __name__ == "__main__":
-    runner = CatFollowerRunner(show_preview=True)
-    runner.main()
+    engine = DetectionEngine()
+    engine.add_subscriber(CatFollowerRunner())
+    engine.add_subscriber(PreviewSubscriber())
+    engine.main()
@@ -0,0 +1,26 @@
+"""
+Buzz, follow, record and log cats at the same time, sharing a single camera and YOLO model.
+
+Each consumer runs on its own thread behind the shared `DetectionEngine`, so e.g. the buzzer
+sleeping while it beeps doesn't slow down the follower or the recording.
+
+Settings are read from `cat_detector.toml` next to this script, and can be changed while it runs.
+"""
+from datetime import datetime
+import os
+
+from cat_buzzer import CatBuzzerRunner
+from cat_follower import CatFollowerRunner
+from detection_engine import DetectionEngine, LoggerSubscriber, PreviewSubscriber, RecorderSubscriber
+
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cat_detector.toml")
+
+if __name__ == "__main__":
+    engine = DetectionEngine(config_path=CONFIG_PATH)
+    engine.add_subscriber(CatBuzzerRunner())
+    engine.add_subscriber(CatFollowerRunner())
+    engine.add_subscriber(RecorderSubscriber(f"cats_{datetime.now():%Y%m%d_%H%M%S}.mp4"))
+    engine.add_subscriber(LoggerSubscriber(CatBuzzerRunner.DEFAULT_CLASSES))
+    engine.add_subscriber(PreviewSubscriber())
+    engine.main()
@@ -0,0 +1,289 @@
+"""
+Runtime configuration for the cat detector, loaded from a TOML file and reloaded while running.
+
+Every section is optional: a section missing from the file leaves the runners' own defaults alone.
+See `cat_detector.toml` for all the settings and their defaults.
+
+`ConfigWatcher` watches the file with inotify (falling back to polling its modification time where
+inotify isn't available) and reloads it on every change. The engine picks the new config up at the
+next frame boundary and only rebuilds what changed: e.g. new detection classes recompile the class
+maps but keep the loaded model, and new buzzer settings only recreate the buzzer.
+"""
+import ctypes
+import ctypes.util
+from dataclasses import dataclass, field, fields, replace
+import os
+import select
+import struct
+import threading
+import time
+import tomllib
+from typing import Any, Dict, Optional, Set, Tuple
+from colorzero import Color
+
+import logging
+
+logging.basicConfig(level=logging.INFO)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class DetectionClass:
+    name: str
+    confidence: float
+    color: Optional[Color] = None
+    buzz: bool = True
+
+
+# The classes the buzzer reacts to by default, also used to mine recordings in `batch_analysis.py`
+DEFAULT_DETECTION_CLASSES = (
+    DetectionClass("cat", 0.5, Color("red")),
+    DetectionClass("teddy bear", 0.5, Color("blue")),
+    DetectionClass("person", 0.8, buzz=False),
+)
+
+
+@dataclass(frozen=True)
+class BuzzerConfig:
+    pin: int = 17
+    duration: float = 0.1
+    enabled: bool = True
+
+
+@dataclass(frozen=True)
+class LedConfig:
+    pins: Tuple[int, int, int] = (5, 6, 13)
+    common_cathode: bool = False
+    idle_color: Color = Color("green")
+
+
+@dataclass(frozen=True)
+class CameraConfig:
+    size: Tuple[int, int] = (1280, 1280)
+    # Picamera2 controls, e.g. {"ExposureTime": 10000}, applied without reconfiguring the camera
+    controls: Dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass(frozen=True)
+class ServoConfig:
+    channel: int
+    pulse_range: Tuple[int, int]
+    actuation_range: int
+
+
+@dataclass(frozen=True)
+class FollowerConfig:
+    # Names of the detection classes to follow, their thresholds come from `classes`
+    classes: Tuple[str, ...] = ("cat", "teddy bear")
+    pan: ServoConfig = ServoConfig(0, (400, 2680), 180)
+    tilt: ServoConfig = ServoConfig(1, (1550, 2500), 90)
+    pan_gain: float = 10.0
+    tilt_gain: float = 8.0
+    deadband: float = 0.05
+
+
+@dataclass(frozen=True)
+class RuntimeConfig:
+    # The model can't be swapped while running, a change only logs a warning
+    model: Optional[str] = None
+    classes: Optional[Tuple[DetectionClass, ...]] = None
+    buzzer: Optional[BuzzerConfig] = None
+    led: Optional[LedConfig] = None
+    camera: Optional[CameraConfig] = None
+    follower: Optional[FollowerConfig] = None
+
+    def changed_sections(self, other: Optional["RuntimeConfig"]) -> Set[str]:
+        """
+        Names of the sections which differ between this config and `other` (all of them if `other` is None).
+        """
+        return {f.name for f in fields(self) if other is None or getattr(self, f.name) != getattr(other, f.name)}
+
+
+def _typed(value: Any, expected: type, name: str) -> Any:
+    """
+    Return `value` if it's an `expected` (a TOML table is a dict, an array a list), raise ValueError otherwise.
+    """
+    if not isinstance(value, expected):
+        kind = {dict: "a table", list: "an array"}.get(expected, expected.__name__)
+        raise ValueError(f"'{name}' must be {kind}, got {value!r}")
+    return value
+
+
+def _detection_class(spec: Dict[str, Any]) -> DetectionClass:
+    _typed(spec, dict, "detection.classes[]")
+    color = spec.get("color")
+    return DetectionClass(
+        spec["name"], float(spec["confidence"]), Color(color) if color else None, spec.get("buzz", True)
+    )
+
+
+def _servo(spec: Dict[str, Any], default: ServoConfig, name: str) -> ServoConfig:
+    _typed(spec, dict, name)
+    return ServoConfig(
+        channel=spec.get("channel", default.channel),
+        pulse_range=tuple(spec.get("pulse_range", default.pulse_range)),
+        actuation_range=spec.get("actuation_range", default.actuation_range),
+    )
+
+
+def load_config(path: str) -> RuntimeConfig:
+    """
+    Load a `RuntimeConfig` from a TOML file. Raises ValueError (or an OSError) if it can't be used.
+    """
+    with open(path, "rb") as f:
+        data = tomllib.load(f)
+
+    try:
+        detection = _typed(data.get("detection", {}), dict, "detection")
+        config = RuntimeConfig(model=detection.get("model"))
+        if "classes" in detection:
+            classes = _typed(detection["classes"], list, "detection.classes")
+            config = replace(config, classes=tuple(_detection_class(spec) for spec in classes))
+        if "buzzer" in data:
+            config = replace(config, buzzer=BuzzerConfig(**_typed(data["buzzer"], dict, "buzzer")))
+        if "led" in data:
+            led = dict(_typed(data["led"], dict, "led"))
+            if "pins" in led:
+                led["pins"] = tuple(_typed(led["pins"], list, "led.pins"))
+            if "idle_color" in led:
+                led["idle_color"] = Color(led["idle_color"])
+            config = replace(config, led=LedConfig(**led))
+        if "camera" in data:
+            camera = dict(_typed(data["camera"], dict, "camera"))
+            if "size" in camera:
+                camera["size"] = tuple(_typed(camera["size"], list, "camera.size"))
+            _typed(camera.get("controls", {}), dict, "camera.controls")
+            config = replace(config, camera=CameraConfig(**camera))
+        if "follower" in data:
+            follower = dict(_typed(data["follower"], dict, "follower"))
+            defaults = FollowerConfig()
+            if "classes" in follower:
+                follower["classes"] = tuple(_typed(follower["classes"], list, "follower.classes"))
+            follower["pan"] = _servo(follower.get("pan", {}), defaults.pan, "follower.pan")
+            follower["tilt"] = _servo(follower.get("tilt", {}), defaults.tilt, "follower.tilt")
+            config = replace(config, follower=FollowerConfig(**follower))
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError(f"Invalid config {path}: {e}") from e
+    return config
+
+
+class _Inotify:
+    """
+    Minimal inotify binding through ctypes, watching a single directory.
+    """
+
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    EVENT_HEADER = struct.Struct("iIII")
+
+    def __init__(self, directory: str):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = libc.inotify_init1(os.O_CLOEXEC | os.O_NONBLOCK)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        # Watch the directory rather than the file, editors often save by replacing the file
+        mask = self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), mask) < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {directory}")
+
+    def read_names(self, timeout: float) -> Set[str]:
+        """
+        Wait up to `timeout` seconds for events and return the names of the files they were for.
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+
+        names = set()
+        offset = 0
+        while offset < len(data):
+            _, _, _, length = self.EVENT_HEADER.unpack_from(data, offset)
+            offset += self.EVENT_HEADER.size
+            names.add(os.fsdecode(data[offset : offset + length].rstrip(b"\0")))
+            offset += length
+        return names
+
+    def close(self):
+        os.close(self.fd)
+
+
+class ConfigWatcher:
+    """
+    Keep `config` up to date with the file at `path` from a background thread.
+
+    `config` is swapped in as a whole, so readers on other threads always see a complete config.
+    A file which fails to load is logged and ignored, keeping the last good config.
+    """
+
+    def __init__(self, path: str, debounce: float = 0.1, poll_interval: float = 1.0):
+        self.path = os.path.abspath(path)
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.config = load_config(self.path)
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._watch, name="config-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+
+    def reload(self):
+        try:
+            config = load_config(self.path)
+        except (OSError, ValueError, tomllib.TOMLDecodeError) as e:
+            logger.warning(f"Ignoring config change, could not load {self.path}: {e}")
+            return
+        if config != self.config:
+            logger.info(f"Reloaded config {self.path}, changed: {sorted(config.changed_sections(self.config))}")
+            self.config = config
+
+    def _safe_reload(self):
+        # Anything load_config doesn't anticipate must not end the watcher thread, and with it hot reloading
+        try:
+            self.reload()
+        except Exception:
+            logger.exception(f"Ignoring config change, unexpected error reloading {self.path}")
+
+    def _watch(self):
+        try:
+            inotify = _Inotify(os.path.dirname(self.path))
+        except (OSError, AttributeError) as e:
+            logger.warning(f"inotify unavailable ({e}), polling {self.path} for changes instead")
+            self._poll()
+            return
+
+        file_name = os.path.basename(self.path)
+        try:
+            while not self._stop_event.is_set():
+                if file_name in inotify.read_names(timeout=0.5):
+                    # Let the editor finish writing, and coalesce the burst of events a save causes
+                    time.sleep(self.debounce)
+                    inotify.read_names(timeout=0)
+                    self._safe_reload()
+        finally:
+            inotify.close()
+
+    def _poll(self):
+        last_mtime = None
+        while not self._stop_event.wait(self.poll_interval):
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+            except OSError:
+                continue
+            if last_mtime is not None and mtime != last_mtime:
+                self._safe_reload()
+            last_mtime = mtime
@@ -0,0 +1,857 @@
+"""
+A shared detection engine which owns a single camera and a single YOLO model.
+
+Each captured frame is run through the model once and the resulting detections are
+published to any number of subscribers (buzzer, follower, recorder, logger, ...).
+Every subscriber runs on its own thread and reads from a latest-value slot, so a slow
+subscriber only ever skips frames itself and never holds back the camera or the others.
+
+Frames are read straight out of the Picamera2 request buffers and letterboxed into a
+preallocated model input (see `preprocessing.py`), so the camera buffer is only copied
+when a subscriber asks for the frame with `needs_frame`.
+
+The model runs either through ultralytics (`backend="ultralytics"`) or directly on ncnn
+(`backend="ncnn"`, see `ncnn_backend.py`), which skips ultralytics' per-frame overhead. With a `remote` inference server (see
+`inference_server.py`) the frames are sent over the network instead, and the local model is
+only used while the server is unreachable or too slow.
+
+Pass a `trace_path` to record a per-frame timeline of every stage and subscriber (see `tracing.py`).
+
+Pass a `config_path` to configure the engine and its subscribers from a TOML file, which is
+reloaded on every change while running (see `config.py`).
+
+The process RSS is logged by component (camera, model, frame buffers, ...) at startup and every
+`memory_report_interval` seconds (see `memory.py`). Pass `low_memory=True` on 1-2 GB boards.
+
+Usage:
+    engine = DetectionEngine()
+    engine.add_subscriber(LoggerSubscriber())
+    engine.add_subscriber(PreviewSubscriber())
+    engine.main()
+"""
+from dataclasses import dataclass, field, replace
+import gc
+import multiprocessing
+import threading
+import time
+from typing import TYPE_CHECKING, Dict, Generic, Iterator, List, Optional, Set, Tuple, TypeVar, Union
+import cv2
+import os
+import numpy as np
+
+from config import CameraConfig, ConfigWatcher, DetectionClass, RuntimeConfig
+from inference_server import RemoteDetector
+from memory import MemoryReport
+from ncnn_backend import NcnnDetector
+from preprocessing import FramePool, Letterbox
+from tracing import DEFAULT_MAX_EVENTS, tracer
+
+if TYPE_CHECKING:
+    # picamera2 is only imported to open the real camera, so the engine also runs with a simulated one.
+    # torch and ultralytics are only imported when the ultralytics backend is used, ncnn runs never load libtorch
+    from picamera2 import MappedArray, Picamera2
+    from ultralytics import YOLO
+    from ultralytics.engine.results import Results
+
+import logging
+
+logging.basicConfig(level=logging.INFO)
+
+logger = logging.getLogger(__name__)
+
+
+MODELS_DIR = ".models/"
+BACKENDS = ("ultralytics", "ncnn")
+# In low-memory mode: one buffer being processed and one being filled, and a smaller trace buffer
+LOW_MEMORY_CAMERA_BUFFERS = 2
+LOW_MEMORY_TRACE_EVENTS = 20_000
+
+T = TypeVar("T")
+
+
+class StopDetectionLoop(Exception):
+    """Custom exception to stop the detection loop."""
+
+    pass
+
+
+@dataclass
+class Detections:
+    """
+    The detections for a single frame, as plain NumPy arrays.
+    `boxes` are (N, 4) xyxy pixel coordinates in the frame, `confidences` and `class_ids` are (N,).
+    `frame` is only set when a subscriber needs it, and is recycled by the engine after a few frames.
+    """
+
+    frame_id: int
+    timestamp: float
+    frame_shape: Tuple[int, ...]
+    frame: Optional[np.ndarray]
+    boxes: np.ndarray
+    confidences: np.ndarray
+    class_ids: np.ndarray
+    names: Dict[int, str]
+    speed: Dict[str, float] = field(default_factory=dict)
+    results: Optional["Results"] = None
+
+    @classmethod
+    def from_results(
+        cls,
+        frame_id: int,
+        timestamp: float,
+        frame_shape: Tuple[int, ...],
+        frame: Optional[np.ndarray],
+        results: "Results",
+        letterbox: Optional[Letterbox] = None,
+    ) -> "Detections":
+        """
+        Build detections from an ultralytics result. If the model was fed a letterboxed input,
+        pass the `letterbox` so the boxes are mapped back to frame coordinates.
+        """
+        boxes = results.boxes
+        # The NumPy view shares memory with the result, copy it so scaling doesn't rewrite the result's boxes
+        xyxy = boxes.xyxy.cpu().numpy().copy()
+        if letterbox is not None:
+            letterbox.scale_boxes(xyxy)
+        return cls(
+            frame_id=frame_id,
+            timestamp=timestamp,
+            frame_shape=frame_shape,
+            frame=frame,
+            boxes=xyxy,
+            confidences=boxes.conf.cpu().numpy(),
+            class_ids=boxes.cls.cpu().numpy().astype(np.int64),
+            names=results.names,
+            speed=dict(results.speed),
+            results=results,
+        )
+
+    def __len__(self) -> int:
+        return len(self.class_ids)
+
+    def plot(self, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Return an annotated copy of the frame.
+        Pass a frame-shaped `out` buffer to reuse it instead of allocating a new copy every frame.
+        `frame` itself is never drawn on, other subscribers are reading it at the same time.
+        """
+        # Not `results.plot()`: the model was fed the letterboxed input, so that's the image the results hold
+        if out is None:
+            annotated_frame = self.frame.copy()
+        else:
+            annotated_frame = out
+            np.copyto(annotated_frame, self.frame)
+        for box, confidence, class_id in zip(self.boxes.astype(int), self.confidences, self.class_ids):
+            x1, y1, x2, y2 = box
+            cv2.rectangle(annotated_frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
+            label = f"{self.names.get(int(class_id), class_id)} {confidence:.2f}"
+            cv2.putText(annotated_frame, label, (x1, max(y1 - 5, 15)), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
+        return annotated_frame
+
+    def matches(
+        self, ids_to_detection_classes: Dict[int, DetectionClass]
+    ) -> Iterator[Tuple[DetectionClass, np.ndarray, float]]:
+        """
+        Yield (detection_class, box, confidence) for every box whose class is in the map
+        and whose confidence clears that class's threshold.
+        """
+        for box, confidence, class_id in zip(self.boxes, self.confidences, self.class_ids):
+            detection_class = ids_to_detection_classes.get(int(class_id))
+            if detection_class is not None and confidence >= detection_class.confidence:
+                yield detection_class, box, float(confidence)
+
+
+class LatestValueSlot(Generic[T]):
+    """
+    A single-producer / single-consumer mailbox which only ever holds the newest value.
+
+    The producer never blocks: `put` swaps in a new (sequence, value) tuple, which is a single
+    atomic reference assignment, so older values the consumer has not read yet are simply dropped.
+    The event is only used to wake a waiting consumer; it never guards the value itself.
+    """
+
+    def __init__(self):
+        self._latest: Optional[Tuple[int, T]] = None
+        self._sequence = 0
+        self._taken = 0
+        self._event = threading.Event()
+        self.dropped = 0
+
+    def put(self, value: T):
+        self._sequence += 1
+        self._latest = (self._sequence, value)
+        self._event.set()
+
+    def get(self, timeout: Optional[float] = None) -> Optional[T]:
+        """
+        Return the newest value not yet taken, waiting up to `timeout` seconds for one.
+        Returns None if nothing new arrived in time.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            self._event.clear()
+            latest = self._latest
+            if latest is not None and latest[0] != self._taken:
+                sequence, value = latest
+                self.dropped += sequence - self._taken - 1
+                self._taken = sequence
+                return value
+
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return None
+            if not self._event.wait(remaining):
+                return None
+
+
+class DetectionSubscriber:
+    """
+    Base class for consumers of the detection engine.
+    `on_detections` is called on the subscriber's own thread with the newest detections;
+    raise `StopDetectionLoop` from it to stop the whole engine.
+    """
+
+    name: str = "subscriber"
+    # Set to True if `on_detections` uses `detections.frame`
+    needs_frame: bool = False
+
+    def setup(self, engine: "DetectionEngine"):
+        """Called once on the engine thread after the model is loaded, before any frames are published."""
+        pass
+
+    def on_detections(self, detections: Detections):
+        raise NotImplementedError
+
+    def reconfigure(self, config: RuntimeConfig, changed: Set[str]):
+        """
+        Apply the `changed` sections of a new runtime config. Called after `setup` with every section,
+        then on the subscriber's own thread between frames whenever the config file changes.
+        """
+        pass
+
+    def close(self):
+        """Called once on the engine thread after the subscriber thread has stopped."""
+        pass
+
+
+class DetectionEngine:
+    """
+    Owns the camera and model, runs capture + predict on the calling thread and fans the
+    detections out to the registered subscribers.
+    """
+
+    picam: "Picamera2"
+    model: Union["YOLO", NcnnDetector]
+
+    def __init__(
+        self,
+        model_name: str = "yolo11n",
+        backend: str = "ultralytics",
+        remote: Optional[RemoteDetector] = None,
+        trace_path: Optional[str] = None,
+        camera: Optional["Picamera2"] = None,
+        model: Optional[Union["YOLO", NcnnDetector]] = None,
+        config_path: Optional[str] = None,
+        low_memory: bool = False,
+        memory_report_interval: float = 300.0,
+    ):
+        """
+        `camera` and `model` replace the Picamera2 camera and the loaded model, e.g. with simulated ones.
+        `low_memory` trades some speed for a smaller footprint on 1-2 GB boards: fewer camera buffers,
+        the NCNN export in a separate process and leaner ncnn settings.
+        """
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend '{backend}', expected one of {BACKENDS}")
+        self.low_memory = low_memory
+        self.memory = MemoryReport(interval=memory_report_interval)
+        if trace_path is not None:
+            tracer.enable(trace_path, max_events=LOW_MEMORY_TRACE_EVENTS if low_memory else DEFAULT_MAX_EVENTS)
+
+        self.config_watcher = ConfigWatcher(config_path) if config_path is not None else None
+        self.config = self.config_watcher.config if self.config_watcher is not None else RuntimeConfig()
+        # The watcher's config last picked up, `self.config` differs from it when a section couldn't be applied
+        self._loaded_config = self.config
+        model_name = self.config.model or model_name
+
+        # Set up the camera with Picam
+        logger.info("Setting up camera...")
+        with self.memory.measure("camera"):
+            if camera is not None:
+                self.picam = camera
+            else:
+                self.picam = self.setup_camera(
+                    self.config.camera.size if self.config.camera else (1280, 1280),
+                    buffer_count=LOW_MEMORY_CAMERA_BUFFERS if low_memory else None,
+                )
+            self.picam.configure("preview")
+            if self.config.camera is not None and self.config.camera.controls:
+                self.picam.set_controls(self.config.camera.controls)
+
+        # Load a YOLO11n PyTorch model
+        logger.info("Setting up detection model...")
+        with self.memory.measure("model"):
+            if model is not None:
+                self.model = model
+            elif backend == "ncnn":
+                self.model = NcnnDetector(
+                    self.export_ncnn_model(model_name, low_memory=low_memory), low_memory=low_memory
+                )
+            else:
+                self.model = self.load_yolo_model(model_name, low_memory=low_memory)
+        self.imgsz = self.model.imgsz if isinstance(self.model, NcnnDetector) else 640
+        # Models like `CascadeDetector` take the camera frame as-is instead of a letterboxed input
+        self.reads_frames = getattr(self.model, "reads_frames", False)
+        if self.reads_frames and remote is not None:
+            raise ValueError("Remote inference needs a model which takes letterboxed inputs")
+        self.names_to_ids = {class_name: class_id for class_id, class_name in self.model.names.items()}
+
+        self.remote = remote
+        self.frame_id = 0
+        self.letterbox: Optional[Letterbox] = None
+        self.frame_pool: Optional[FramePool] = None
+        self._prepared_shape: Optional[Tuple[int, ...]] = None
+        self._stop_event = threading.Event()
+        self._subscribers: List[Tuple[DetectionSubscriber, LatestValueSlot[Detections]]] = []
+        self._slots: List[LatestValueSlot[Detections]] = []
+        self._threads: List[threading.Thread] = []
+
+    def add_subscriber(self, subscriber: DetectionSubscriber) -> DetectionSubscriber:
+        """
+        Register a subscriber which will be run on its own thread once the engine starts.
+        """
+        slot = self.subscribe()
+        self._subscribers.append((subscriber, slot))
+        return subscriber
+
+    def subscribe(self) -> LatestValueSlot[Detections]:
+        """
+        Return a new slot which will receive the latest detections of every frame.
+        Use this to consume detections from a thread you manage yourself.
+        """
+        slot: LatestValueSlot[Detections] = LatestValueSlot()
+        self._slots.append(slot)
+        return slot
+
+    def class_map(self, detection_classes: List[DetectionClass]) -> Dict[int, DetectionClass]:
+        """
+        Map the model's class ids to the given detection classes, skipping names the model doesn't know.
+        """
+        return {self.names_to_ids[dc.name]: dc for dc in detection_classes if dc.name in self.names_to_ids}
+
+    def main(self):
+        self.start()
+        try:
+            while not self._stop_event.is_set():
+                self.run_loop()
+        except (StopDetectionLoop, KeyboardInterrupt) as e:
+            logger.info(f"Stopping detection loop... {e}")
+        finally:
+            self.shutdown()
+
+    def start(self):
+        self._stop_event.clear()
+        self._prepared_shape = None
+        for subscriber, _ in self._subscribers:
+            subscriber.setup(self)
+            subscriber.reconfigure(self.config, self.config.changed_sections(None))
+        for subscriber, slot in self._subscribers:
+            thread = threading.Thread(
+                target=self._run_subscriber, args=(subscriber, slot), name=subscriber.name, daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+        with self.memory.measure("camera"):
+            self.picam.start()
+        if self.config_watcher is not None:
+            self.config_watcher.start()
+        self.memory.log("Memory at startup")
+
+    def stop(self):
+        """
+        Ask the engine to stop after the current frame. Safe to call from any thread.
+        """
+        self._stop_event.set()
+
+    def shutdown(self):
+        self.stop()
+        for thread in self._threads:
+            thread.join(timeout=2)
+        self._threads = []
+        for subscriber, slot in self._subscribers:
+            if slot.dropped:
+                logger.info(f"Subscriber '{subscriber.name}' skipped {slot.dropped} frames")
+            subscriber.close()
+        self.picam.stop()
+        if self.remote is not None:
+            self.remote.close()
+        if self.config_watcher is not None:
+            self.config_watcher.stop()
+
+    def run_loop(self) -> Optional[Detections]:
+        """
+        Capture a single frame, run the model on it and publish the detections.
+        When offloading to a remote server, publish whatever remote results have arrived instead
+        and return the newest of them, if any.
+        """
+        self.apply_config_changes()
+        self.memory.maybe_log()
+
+        self.frame_id += 1
+        with tracer.span("frame", frame_id=self.frame_id):
+            use_remote = not self.reads_frames and self.remote is not None and self.remote.available()
+            # Only frames which are run or submitted go into the frame pool: the pool is sized for the frames in
+            # flight, copying the frames the server has no room for would overwrite those before they come back
+            submit = use_remote and self.remote.can_submit()
+            # Borrow the next camera buffer, it must be released as soon as we're done with it
+            with tracer.span("capture"):
+                request = self.picam.capture_request()
+            timestamp = time.monotonic()
+            try:
+                with self.map_request(request) as mapped:
+                    with tracer.span("prepare_frame"):
+                        frame_shape, model_input, frame = self.prepare_frame(
+                            mapped.array, keep_frame=submit or not use_remote
+                        )
+                    if self.reads_frames:
+                        # The model reads the full frame itself, so it runs before the buffer is released
+                        detections = self.timed_predict(
+                            self.frame_id, timestamp, frame_shape, frame, mapped.array[:, :, :3]
+                        )
+            finally:
+                request.release()
+
+            if not self.reads_frames:
+                if use_remote:
+                    return self.run_remote(self.frame_id, timestamp, frame_shape, frame, submit)
+                if self.remote is not None:
+                    # Drop results which arrived before the server fell behind, they're older than this frame
+                    self.remote.completed()
+
+                detections = self.timed_predict(self.frame_id, timestamp, frame_shape, frame, model_input)
+
+            with tracer.span("publish"):
+                self.publish(detections)
+            return detections
+
+    def apply_config_changes(self):
+        """
+        Pick up a reloaded config at the frame boundary, rebuilding only the parts of the engine it changes.
+        Subscribers pick it up themselves before their next frame.
+        """
+        if self.config_watcher is None or self.config_watcher.config is self._loaded_config:
+            return
+        config = self._loaded_config = self.config_watcher.config
+        changed = config.changed_sections(self.config)
+
+        with tracer.span("apply_config", changed=sorted(changed)):
+            if "model" in changed and config.model is not None:
+                logger.warning(f"Changing the model to '{config.model}' needs a restart, keeping the loaded model")
+            if "camera" in changed:
+                previous = self.config.camera or CameraConfig()
+                try:
+                    self.configure_camera(config.camera or CameraConfig(), previous)
+                except Exception as e:
+                    # e.g. an unknown control name or an unsupported size, which only the camera can tell
+                    logger.warning(f"Ignoring camera config change, could not apply it: {e}")
+                    try:
+                        self.configure_camera(previous, config.camera or CameraConfig())
+                    except Exception:
+                        logger.exception("Could not restore the previous camera config, keeping the camera as it is")
+                    config = replace(config, camera=self.config.camera)
+            self.config = config
+
+    def configure_camera(self, camera_config: CameraConfig, previous: CameraConfig):
+        """
+        Apply new camera settings. Controls are set on the running camera, a new size restarts the
+        stream with the new configuration but keeps the camera open.
+        """
+        if camera_config.size != previous.size:
+            logger.info(f"Reconfiguring camera to {camera_config.size}...")
+            self.picam.stop()
+            self.picam.preview_configuration.main.size = camera_config.size
+            self.picam.preview_configuration.align()
+            self.picam.configure("preview")
+            self.picam.start()
+        if camera_config.controls:
+            self.picam.set_controls(camera_config.controls)
+
+    @staticmethod
+    def map_request(request) -> "MappedArray":
+        """
+        Map the main stream of a capture request, without copying. Use as a context manager.
+        """
+        from picamera2 import MappedArray
+
+        return MappedArray(request, "main")
+
+    def run_remote(
+        self,
+        frame_id: int,
+        timestamp: float,
+        frame_shape: Tuple[int, ...],
+        frame: Optional[np.ndarray],
+        submit: bool = True,
+    ) -> Optional[Detections]:
+        """
+        Send the letterboxed frame to the remote server if `submit` (there was room in flight when it
+        was captured), and publish every result received since the last frame.
+        """
+        if submit:
+            with tracer.span("remote_submit"):
+                self.remote.submit(self.letterbox.canvas, (frame_id, timestamp, frame_shape, frame))
+
+        detections = None
+        for result in self.remote.completed():
+            frame_id, timestamp, frame_shape, frame = result.context
+            detections = Detections(
+                frame_id=frame_id,
+                timestamp=timestamp,
+                frame_shape=frame_shape,
+                frame=frame,
+                boxes=self.letterbox.scale_boxes(result.boxes),
+                confidences=result.confidences,
+                class_ids=result.class_ids,
+                names=self.remote.names,
+                speed=result.speed,
+            )
+            self.publish(detections)
+        return detections
+
+    def timed_predict(
+        self,
+        frame_id: int,
+        timestamp: float,
+        frame_shape: Tuple[int, ...],
+        frame: Optional[np.ndarray],
+        model_input: np.ndarray,
+    ) -> Detections:
+        start = tracer.now()
+        detections = self.predict(frame_id, timestamp, frame_shape, frame, model_input)
+        tracer.add_span("predict", start, tracer.now() - start)
+        tracer.add_speed_spans(start, detections.speed)
+        return detections
+
+    def predict(
+        self,
+        frame_id: int,
+        timestamp: float,
+        frame_shape: Tuple[int, ...],
+        frame: Optional[np.ndarray],
+        model_input: np.ndarray,
+    ) -> Detections:
+        """
+        Run the model on a letterboxed input (or the camera frame itself, for models which `reads_frames`)
+        and return the detections in frame coordinates.
+        """
+        if self.reads_frames:
+            boxes, confidences, class_ids, speed = self.model.detect_frame(model_input)
+            return Detections(
+                frame_id=frame_id,
+                timestamp=timestamp,
+                frame_shape=frame_shape,
+                frame=frame,
+                boxes=boxes,
+                confidences=confidences,
+                class_ids=class_ids,
+                names=self.model.names,
+                speed=speed,
+            )
+
+        if isinstance(self.model, NcnnDetector):
+            boxes, confidences, class_ids, speed = self.model.detect(model_input)
+            return Detections(
+                frame_id=frame_id,
+                timestamp=timestamp,
+                frame_shape=frame_shape,
+                frame=frame,
+                boxes=self.letterbox.scale_boxes(boxes),
+                confidences=confidences,
+                class_ids=class_ids,
+                names=self.model.names,
+                speed=speed,
+            )
+
+        # Run YOLO model on the letterboxed input and store the results
+        # The input is already a normalised NCHW batch of one, so ultralytics skips its own preprocessing
+        import torch
+
+        results: "Results" = self.model.predict(torch.from_numpy(model_input), verbose=False)[0]
+        return Detections.from_results(frame_id, timestamp, frame_shape, frame, results, self.letterbox)
+
+    def prepare_frame(
+        self, frame: np.ndarray, keep_frame: bool = True
+    ) -> Tuple[Tuple[int, ...], Optional[np.ndarray], Optional[np.ndarray]]:
+        """
+        Letterbox a camera frame into the preallocated model input, and copy it into the frame pool
+        if any subscriber needs it and `keep_frame`. Returns (frame_shape, model_input, pooled_frame).
+        The model input is None for models which `reads_frames`, they letterbox the frame themselves.
+        """
+        # Picamera2's "RGB888" is BGR in memory, which is what the letterbox expects
+        frame = frame[:, :, :3]
+        if frame.shape != self._prepared_shape:
+            self.letterbox = None if self.reads_frames else Letterbox(frame.shape, imgsz=self.imgsz)
+            self.frame_pool = None
+            if any(subscriber.needs_frame for subscriber, _ in self._subscribers):
+                # Each subscriber and remote request may be holding on to one frame while the engine fills the next
+                in_flight = self.remote.max_in_flight if self.remote is not None else 0
+                self.frame_pool = FramePool(frame.shape, size=len(self._subscribers) + in_flight + 2)
+            self._prepared_shape = frame.shape
+            self.memory.set_size("letterbox", self.letterbox.nbytes if self.letterbox is not None else 0)
+            self.memory.set_size("frame pool", self.frame_pool.nbytes if self.frame_pool is not None else 0)
+
+        model_input = self.letterbox(frame) if self.letterbox is not None else None
+        pooled_frame = self.frame_pool.copy(frame) if self.frame_pool is not None and keep_frame else None
+        return frame.shape, model_input, pooled_frame
+
+    def publish(self, detections: Detections):
+        for slot in self._slots:
+            slot.put(detections)
+
+    def _run_subscriber(self, subscriber: DetectionSubscriber, slot: LatestValueSlot[Detections]):
+        applied_config = self.config
+        while not self._stop_event.is_set():
+            detections = slot.get(timeout=0.1)
+            if detections is None:
+                continue
+            try:
+                config = self.config
+                if config is not applied_config:
+                    changed, applied_config = config.changed_sections(applied_config), config
+                    try:
+                        with tracer.span("reconfigure"):
+                            subscriber.reconfigure(config, changed)
+                    except Exception:
+                        # Don't retry every frame, keep handling detections with whatever did get applied
+                        logger.exception(f"Subscriber '{subscriber.name}' failed to apply the new config")
+                with tracer.span(subscriber.name, frame_id=detections.frame_id):
+                    subscriber.on_detections(detections)
+            except StopDetectionLoop as e:
+                logger.info(f"Subscriber '{subscriber.name}' stopped the engine: {e}")
+                self.stop()
+            except Exception:
+                logger.exception(f"Subscriber '{subscriber.name}' failed to handle frame {detections.frame_id}")
+
+    @staticmethod
+    def setup_camera(size: Tuple[int, int] = (1280, 1280), buffer_count: Optional[int] = None) -> "Picamera2":
+        """
+        Set up the Picamera2 camera with the desired configuration.
+        Once returned, the camera still needs to be started with `picam2.start()`.
+        """
+        from picamera2 import Picamera2
+
+        # Set up the camera with Picam
+        picam2 = Picamera2()
+        picam2.preview_configuration.main.size = size
+        picam2.preview_configuration.main.format = "RGB888"
+        if buffer_count is not None:
+            picam2.preview_configuration.buffer_count = buffer_count
+            # Don't keep an extra finished frame queued, `capture_request` then waits for the next one instead
+            picam2.preview_configuration.queue = False
+        picam2.preview_configuration.align()
+        return picam2
+
+    @staticmethod
+    def load_yolo_model(model_name: str = "yolo11n", low_memory: bool = False) -> "YOLO":
+        """
+        Load the YOLO model with the specified name.
+        If the NCNN version of the model does not exist, it will be downloaded and
+        created from the PyTorch version.
+        """
+        model_dir = DetectionEngine.export_ncnn_model(model_name, low_memory=low_memory)
+
+        logger.info("Loading NCNN model...")
+        from ultralytics import YOLO
+
+        # Load the exported NCNN model
+        model = YOLO(model_dir)
+        return model
+
+    @staticmethod
+    def export_ncnn_model(model_name: str = "yolo11n", imgsz: int = 640, low_memory: bool = False) -> str:
+        """
+        Return the directory of the NCNN export of the model at `imgsz`, downloading and exporting
+        the PyTorch version first if it doesn't exist yet.
+        With `low_memory` the export runs in a child process, so none of its memory stays in this one.
+        """
+        model_dir = _ncnn_model_dir(model_name, imgsz)
+        # Check if the ncnn model already exists
+        if not os.path.exists(model_dir):
+            if low_memory:
+                process = multiprocessing.get_context("spawn").Process(
+                    target=_export_ncnn_model, args=(model_name, imgsz), name="ncnn-export"
+                )
+                process.start()
+                process.join()
+                if process.exitcode != 0:
+                    raise RuntimeError(f"Exporting {model_name} to NCNN failed with exit code {process.exitcode}")
+            else:
+                _export_ncnn_model(model_name, imgsz)
+
+        return model_dir
+
+
+def _ncnn_model_dir(model_name: str, imgsz: int = 640) -> str:
+    # Keep exports at other sizes next to the default one instead of overwriting it
+    if imgsz == 640:
+        return os.path.join(MODELS_DIR, f"{model_name}_ncnn_model")
+    return os.path.join(MODELS_DIR, f"{model_name}_{imgsz}_ncnn_model")
+
+
+def _export_ncnn_model(model_name: str, imgsz: int = 640):
+    """
+    Download the PyTorch version of the model and export it to `_ncnn_model_dir(model_name, imgsz)`.
+    """
+    logger.info("NCNN model not found, downloading PyTorch model...")
+    from ultralytics import YOLO
+
+    # Load a YOLO11n PyTorch model
+    pt_model = YOLO(os.path.join(MODELS_DIR, f"{model_name}.pt"))
+
+    # Export the model to NCNN format
+    logger.info("Exporting model to NCNN format...")
+    export_dir = _ncnn_model_dir(model_name)
+    model_dir = _ncnn_model_dir(model_name, imgsz)
+    if model_dir == export_dir:
+        pt_model.export(format="ncnn")  # creates '{model_name}_ncnn_model'
+    else:
+        # The export always goes to '{model_name}_ncnn_model', so move the default size out of the way
+        moved_dir = f"{export_dir}.default"
+        if os.path.exists(export_dir):
+            os.rename(export_dir, moved_dir)
+        try:
+            pt_model.export(format="ncnn", imgsz=imgsz)
+            os.rename(export_dir, model_dir)
+        finally:
+            if os.path.exists(moved_dir):
+                os.rename(moved_dir, export_dir)
+
+    # Don't keep the PyTorch model and the export's intermediate tensors around next to the NCNN model
+    del pt_model
+    gc.collect()
+    logger.info("NCNN model exported successfully.")
+
+
+class PreviewSubscriber(DetectionSubscriber):
+    """
+    Show the annotated frames in a window. Pressing 'q' stops the engine.
+    """
+
+    name = "preview"
+    needs_frame = True
+
+    def __init__(self):
+        # Annotations are drawn into this buffer, reused every frame
+        self._annotated: Optional[np.ndarray] = None
+
+    def on_detections(self, detections: Detections):
+        # Output the visual detection data, we will draw this on our camera preview window
+        with tracer.span("plot"):
+            if self._annotated is None or self._annotated.shape != detections.frame.shape:
+                self._annotated = np.empty_like(detections.frame)
+            annotated_frame = detections.plot(out=self._annotated)
+
+        # Get inference time
+        inference_time = detections.speed.get("inference")
+        if inference_time:
+            fps = 1000 / inference_time  # Convert to milliseconds
+            text = f"FPS: {fps:.1f}"
+
+            # Define font and position
+            font = cv2.FONT_HERSHEY_SCRIPT_COMPLEX
+            text_size = cv2.getTextSize(text, font, 1, 2)[0]
+            text_x = annotated_frame.shape[1] - text_size[0] - 10  # 10 pixels from the right
+            text_y = text_size[1] + 10  # 10 pixels from the top
+
+            # Draw the text on the annotated frame
+            cv2.putText(annotated_frame, text, (text_x, text_y), font, 1, (255, 255, 255), 2, cv2.LINE_AA)
+
+        # Display the resulting frame
+        with tracer.span("imshow"):
+            cv2.imshow("Camera", annotated_frame)
+
+        # Stop execution if 'q' is pressed
+        with tracer.span("waitKey"):
+            key = cv2.waitKey(1)
+        if key == ord("q"):
+            raise StopDetectionLoop("'q' pressed, stopping detection loop.")
+
+    def close(self):
+        # Close all windows
+        cv2.destroyAllWindows()
+
+
+class LoggerSubscriber(DetectionSubscriber):
+    """
+    Log every detection of the given classes above their confidence threshold.
+    """
+
+    name = "logger"
+
+    def __init__(self, detection_classes: Optional[List[DetectionClass]] = None):
+        self.detection_classes = detection_classes
+        self._ids_to_detection_classes: Dict[int, DetectionClass] = {}
+
+    def setup(self, engine: DetectionEngine):
+        self.engine = engine
+        if self.detection_classes is None:
+            # Log everything the model knows about at 50% confidence
+            self.detection_classes = [DetectionClass(name, 0.5) for name in engine.names_to_ids]
+        # Restored when the classes are removed from the config
+        self._default_classes = self.detection_classes
+        self._ids_to_detection_classes = engine.class_map(self.detection_classes)
+
+    def reconfigure(self, config: RuntimeConfig, changed: Set[str]):
+        if "classes" in changed:
+            self.detection_classes = list(self._default_classes if config.classes is None else config.classes)
+            self._ids_to_detection_classes = self.engine.class_map(self.detection_classes)
+
+    def on_detections(self, detections: Detections):
+        for detection_class, _, confidence in detections.matches(self._ids_to_detection_classes):
+            logger.info(
+                f"Frame {detections.frame_id}: {detection_class.name} detected with confidence {confidence:.2f}"
+            )
+
+
+class RecorderSubscriber(DetectionSubscriber):
+    """
+    Record the camera frames to a video file, optionally with the detections drawn on them.
+    """
+
+    name = "recorder"
+    needs_frame = True
+
+    def __init__(self, output_path: str, fps: float = 10.0, annotate: bool = False):
+        self.output_path = output_path
+        self.fps = fps
+        self.annotate = annotate
+        # Annotations are drawn into this buffer, reused every frame
+        self._annotated: Optional[np.ndarray] = None
+        self._writer: Optional[cv2.VideoWriter] = None
+
+    def on_detections(self, detections: Detections):
+        if self.annotate:
+            if self._annotated is None or self._annotated.shape != detections.frame.shape:
+                self._annotated = np.empty_like(detections.frame)
+            frame = detections.plot(out=self._annotated)
+        else:
+            frame = detections.frame
+
+        if self._writer is None:
+            height, width = frame.shape[:2]
+            fourcc = cv2.VideoWriter_fourcc(*"mp4v")
+            self._writer = cv2.VideoWriter(self.output_path, fourcc, self.fps, (width, height))
+            logger.info(f"Recording {width}x{height} video to {self.output_path}")
+        with tracer.span("write_frame"):
+            self._writer.write(np.ascontiguousarray(frame))
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.release()
+            self._writer = None
+
+
+if __name__ == "__main__":
+    engine = DetectionEngine()
+    engine.add_subscriber(LoggerSubscriber())
+    engine.add_subscriber(PreviewSubscriber())
+    engine.main()
@@ -0,0 +1,456 @@
+"""
+Offload YOLO inference from a small Pi to a stronger machine on the same network.
+
+The `InferenceServer` runs on the strong machine. It accepts any number of clients, batches
+their frames together and sends each client its detections back. The `RemoteDetector` is the
+client used by the detection engine: it sends letterboxed frames (JPEG or zlib-compressed raw),
+keeps several requests in flight, and reports itself unhealthy when round trips go over the
+deadline so the engine can fall back to local inference.
+
+Both ends work on localhost. Start the server with:
+    uv run src/main/raspi_playground/cat_detector/inference_server.py .models/yolo11n.pt 127.0.0.1 5555
+and point the engine at it:
+    engine = DetectionEngine(remote=RemoteDetector("127.0.0.1", 5555))
+"""
+from dataclasses import dataclass
+import json
+import queue
+import socket
+import struct
+import sys
+import threading
+import time
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+import cv2
+import numpy as np
+
+from tracing import tracer
+
+import logging
+
+logging.basicConfig(level=logging.INFO)
+
+logger = logging.getLogger(__name__)
+
+
+ENCODING_RAW = 0
+ENCODING_ZLIB = 1
+ENCODING_JPEG = 2
+ENCODINGS = {"raw": ENCODING_RAW, "zlib": ENCODING_ZLIB, "jpeg": ENCODING_JPEG}
+
+# request_id, encoding, height, width, payload length
+REQUEST_HEADER = struct.Struct("!IBHHI")
+# request_id, number of detections, server side inference time in ms
+RESPONSE_HEADER = struct.Struct("!IIf")
+# length of the JSON hello message the server sends on connect
+HELLO_HEADER = struct.Struct("!I")
+# the client's deadline in seconds, sent in reply to the hello, requests older than that are dropped
+CLIENT_HELLO = struct.Struct("!f")
+
+
+def recv_exactly(sock: socket.socket, size: int) -> bytes:
+    """
+    Read exactly `size` bytes from the socket, raising ConnectionError if it closes first.
+    """
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:], size - received)
+        if count == 0:
+            raise ConnectionError("Socket closed")
+        received += count
+    return bytes(buffer)
+
+
+def encode_frame(frame: np.ndarray, encoding: int, jpeg_quality: int = 85) -> bytes:
+    if encoding == ENCODING_JPEG:
+        ok, encoded = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality])
+        if not ok:
+            raise ValueError("Failed to JPEG encode frame")
+        return encoded.tobytes()
+    if encoding == ENCODING_ZLIB:
+        return zlib.compress(np.ascontiguousarray(frame).data, 1)
+    return np.ascontiguousarray(frame).tobytes()
+
+
+def decode_frame(payload: bytes, encoding: int, height: int, width: int) -> np.ndarray:
+    """
+    Decode a frame sent by `encode_frame`. Raises ValueError if it can't be decoded.
+    """
+    if encoding == ENCODING_JPEG:
+        frame = cv2.imdecode(np.frombuffer(payload, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if frame is None:
+            raise ValueError("Failed to JPEG decode frame")
+        return frame
+    if encoding == ENCODING_ZLIB:
+        try:
+            payload = zlib.decompress(payload)
+        except zlib.error as e:
+            raise ValueError(f"Failed to decompress frame: {e}") from e
+    elif encoding != ENCODING_RAW:
+        raise ValueError(f"Unknown encoding {encoding}")
+    if len(payload) != height * width * 3:
+        raise ValueError(f"Expected {height * width * 3} bytes for a {width}x{height} frame, got {len(payload)}")
+    return np.frombuffer(payload, dtype=np.uint8).reshape(height, width, 3)
+
+
+def encode_detections(
+    request_id: int, boxes: np.ndarray, confidences: np.ndarray, class_ids: np.ndarray, inference_ms: float
+) -> bytes:
+    return b"".join(
+        [
+            RESPONSE_HEADER.pack(request_id, len(class_ids), inference_ms),
+            boxes.astype(np.float32).tobytes(),
+            confidences.astype(np.float32).tobytes(),
+            class_ids.astype(np.int32).tobytes(),
+        ]
+    )
+
+
+def recv_detections(sock: socket.socket) -> Tuple[int, np.ndarray, np.ndarray, np.ndarray, float]:
+    request_id, count, inference_ms = RESPONSE_HEADER.unpack(recv_exactly(sock, RESPONSE_HEADER.size))
+    payload = recv_exactly(sock, count * (4 * 4 + 4 + 4))
+    boxes = np.frombuffer(payload, dtype=np.float32, count=count * 4).reshape(count, 4).copy()
+    confidences = np.frombuffer(payload, dtype=np.float32, count=count, offset=count * 16).copy()
+    class_ids = np.frombuffer(payload, dtype=np.int32, count=count, offset=count * 20).astype(np.int64)
+    return request_id, boxes, confidences, class_ids, inference_ms
+
+
+@dataclass
+class _ServerRequest:
+    connection: "_ClientConnection"
+    request_id: int
+    frame: np.ndarray
+    received: float
+
+
+class _ClientConnection:
+    def __init__(self, sock: socket.socket, address):
+        self.sock = sock
+        self.address = address
+        self.send_lock = threading.Lock()
+        self.deadline = float("inf")
+
+    def send(self, data: bytes):
+        with self.send_lock:
+            self.sock.sendall(data)
+
+
+class InferenceServer:
+    """
+    Serve detections for frames sent by `RemoteDetector` clients.
+
+    Requests from all clients go into one queue. The inference thread takes up to `max_batch`
+    of them, waiting at most `batch_window` seconds after the first one for more, and runs them
+    through the model as a single batch. Requests which have waited longer than their client's
+    deadline are dropped instead, the client has already given up on them.
+    """
+
+    def __init__(
+        self,
+        model_path: str = ".models/yolo11n.pt",
+        host: str = "0.0.0.0",
+        port: int = 5555,
+        max_batch: int = 8,
+        batch_window: float = 0.005,
+        model: Any = None,
+    ):
+        """
+        `model` replaces the YOLO model loaded from `model_path`, it needs the `names` and `predict` of one.
+        """
+        if model is None:
+            from ultralytics import YOLO
+
+            model = YOLO(model_path, task="detect")
+        self.model = model
+        self.max_batch = max_batch
+        self.batch_window = batch_window
+
+        self._server_socket = socket.create_server((host, port))
+        self.address = self._server_socket.getsockname()
+        self._requests: "queue.Queue[_ServerRequest]" = queue.Queue()
+        self._stop_event = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self.dropped = 0
+
+    def start(self):
+        """
+        Start accepting clients and serving requests in background threads.
+        """
+        for target in (self._accept_loop, self._inference_loop):
+            thread = threading.Thread(target=target, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Inference server listening on {self.address[0]}:{self.address[1]}")
+
+    def serve_forever(self):
+        self.start()
+        try:
+            while not self._stop_event.wait(1):
+                pass
+        except KeyboardInterrupt:
+            logger.info("Stopping inference server...")
+        finally:
+            self.stop()
+
+    def stop(self):
+        self._stop_event.set()
+        self._server_socket.close()
+
+    def _accept_loop(self):
+        while not self._stop_event.is_set():
+            try:
+                sock, address = self._server_socket.accept()
+            except OSError:
+                break
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            connection = _ClientConnection(sock, address)
+            hello = json.dumps({"names": self.model.names}).encode()
+            connection.send(HELLO_HEADER.pack(len(hello)) + hello)
+            threading.Thread(target=self._client_loop, args=(connection,), daemon=True).start()
+            logger.info(f"Client connected from {address[0]}:{address[1]}")
+
+    def _client_loop(self, connection: _ClientConnection):
+        try:
+            (connection.deadline,) = CLIENT_HELLO.unpack(recv_exactly(connection.sock, CLIENT_HELLO.size))
+            while not self._stop_event.is_set():
+                header = recv_exactly(connection.sock, REQUEST_HEADER.size)
+                request_id, encoding, height, width, length = REQUEST_HEADER.unpack(header)
+                payload = recv_exactly(connection.sock, length)
+                try:
+                    frame = decode_frame(payload, encoding, height, width)
+                except ValueError as e:
+                    # The client gives up on it after its deadline, a bad frame mustn't reach the model
+                    logger.warning(f"Dropping request {request_id} from {connection.address[0]}: {e}")
+                    continue
+                self._requests.put(_ServerRequest(connection, request_id, frame, time.monotonic()))
+        except (ConnectionError, OSError):
+            logger.info(f"Client {connection.address[0]}:{connection.address[1]} disconnected")
+        finally:
+            connection.sock.close()
+
+    def _next_batch(self) -> List[_ServerRequest]:
+        batch: List[_ServerRequest] = []
+        stale = 0
+        deadline = None
+        while len(batch) < self.max_batch:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                break
+            try:
+                request = self._requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            # Stale requests start the window too, so they're counted even when nothing follows them
+            if deadline is None:
+                deadline = time.monotonic() + self.batch_window
+            if time.monotonic() - request.received > request.connection.deadline:
+                stale += 1
+                continue
+            batch.append(request)
+        if stale:
+            self.dropped += stale
+            logger.warning(f"Dropped {stale} requests older than their client's deadline")
+        return batch
+
+    def _inference_loop(self):
+        while not self._stop_event.is_set():
+            batch = self._next_batch()
+            if not batch:
+                continue
+            try:
+                results = self.model.predict([request.frame for request in batch], verbose=False)
+            except Exception:
+                # Keep serving, the clients of this batch fall back to local inference after their deadline
+                logger.exception(f"Inference failed for a batch of {len(batch)} requests")
+                continue
+            for request, result in zip(batch, results):
+                boxes = result.boxes
+                response = encode_detections(
+                    request.request_id,
+                    boxes.xyxy.cpu().numpy(),
+                    boxes.conf.cpu().numpy(),
+                    boxes.cls.cpu().numpy(),
+                    result.speed["inference"],
+                )
+                try:
+                    request.connection.send(response)
+                except OSError:
+                    # The client went away, its reader thread will clean up
+                    pass
+
+
+@dataclass
+class RemoteResult:
+    """
+    Detections for a frame submitted with `RemoteDetector.submit`, in the sent frame's coordinates.
+    """
+
+    context: Any
+    boxes: np.ndarray
+    confidences: np.ndarray
+    class_ids: np.ndarray
+    speed: Dict[str, float]
+
+
+class RemoteDetector:
+    """
+    Client for `InferenceServer` which keeps up to `max_in_flight` requests outstanding.
+
+    Any request not answered within `deadline` seconds is abandoned, and so is the server for
+    `retry_interval` seconds: `available()` returns False until then so the caller runs locally.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int = 5555,
+        encoding: str = "jpeg",
+        jpeg_quality: int = 85,
+        max_in_flight: int = 2,
+        deadline: float = 0.5,
+        retry_interval: float = 5.0,
+        connect_timeout: float = 2.0,
+        send_timeout: Optional[float] = None,
+    ):
+        """
+        `send_timeout` (by default the `deadline`) bounds how long `submit` blocks on a stalled server.
+        """
+        if encoding not in ENCODINGS:
+            raise ValueError(f"Unknown encoding '{encoding}', expected one of {list(ENCODINGS)}")
+        self.address = (host, port)
+        self.encoding = ENCODINGS[encoding]
+        self.jpeg_quality = jpeg_quality
+        self.max_in_flight = max_in_flight
+        self.deadline = deadline
+        self.retry_interval = retry_interval
+        self.connect_timeout = connect_timeout
+        self.send_timeout = send_timeout if send_timeout is not None else deadline
+        self.names: Dict[int, str] = {}
+        self.last_round_trip: Optional[float] = None
+
+        self._sock: Optional[socket.socket] = None
+        self._next_request_id = 0
+        self._in_flight: Dict[int, Tuple[float, Any]] = {}
+        self._in_flight_lock = threading.Lock()
+        self._completed: "queue.Queue[RemoteResult]" = queue.Queue()
+        self._backoff_until = 0.0
+
+    def available(self) -> bool:
+        """
+        True if the server is connected (or may be reconnected to) and responding within the deadline.
+        """
+        self._expire_in_flight()
+        if time.monotonic() < self._backoff_until:
+            return False
+        if self._sock is None:
+            return self._connect()
+        return True
+
+    def can_submit(self) -> bool:
+        with self._in_flight_lock:
+            return len(self._in_flight) < self.max_in_flight
+
+    def submit(self, frame: np.ndarray, context: Any = None):
+        """
+        Send a BGR frame to the server. `context` is returned with its result by `completed()`.
+        """
+        self._next_request_id = (self._next_request_id + 1) % 2**32
+        request_id = self._next_request_id
+        payload = encode_frame(frame, self.encoding, self.jpeg_quality)
+        header = REQUEST_HEADER.pack(request_id, self.encoding, frame.shape[0], frame.shape[1], len(payload))
+
+        # The receive thread may disconnect at any time, so only use the socket through this reference
+        sock = self._sock
+        if sock is None:
+            return
+        with self._in_flight_lock:
+            self._in_flight[request_id] = (time.monotonic(), context)
+        try:
+            sock.sendall(header + payload)
+        except OSError as e:
+            # Including a send timeout, after which part of the request may have been sent
+            self._disconnect(f"send failed: {e}")
+
+    def completed(self) -> List[RemoteResult]:
+        """
+        Return every result received since the last call, oldest first.
+        """
+        results = []
+        while True:
+            try:
+                results.append(self._completed.get_nowait())
+            except queue.Empty:
+                return results
+
+    def close(self):
+        self._disconnect("closed")
+
+    def _connect(self) -> bool:
+        try:
+            sock = socket.create_connection(self.address, timeout=self.connect_timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            (length,) = HELLO_HEADER.unpack(recv_exactly(sock, HELLO_HEADER.size))
+            hello = json.loads(recv_exactly(sock, length))
+            sock.sendall(CLIENT_HELLO.pack(self.deadline))
+            # Block on receives, but not on sends: SO_SNDTIMEO only applies to sends, unlike settimeout()
+            sock.settimeout(None)
+            seconds, fraction = divmod(self.send_timeout, 1)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDTIMEO, struct.pack("ll", int(seconds), int(fraction * 1e6)))
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not connect to inference server {self.address[0]}:{self.address[1]}: {e}")
+            self._backoff_until = time.monotonic() + self.retry_interval
+            return False
+
+        self.names = {int(class_id): name for class_id, name in hello["names"].items()}
+        self._sock = sock
+        threading.Thread(target=self._receive_loop, args=(sock,), name="remote-receive", daemon=True).start()
+        logger.info(f"Connected to inference server {self.address[0]}:{self.address[1]}")
+        return True
+
+    def _disconnect(self, reason: str):
+        sock, self._sock = self._sock, None
+        if sock is not None:
+            logger.warning(f"Disconnected from inference server: {reason}")
+            sock.close()
+        with self._in_flight_lock:
+            self._in_flight.clear()
+        self._backoff_until = time.monotonic() + self.retry_interval
+
+    def _expire_in_flight(self):
+        now = time.monotonic()
+        with self._in_flight_lock:
+            expired = [request_id for request_id, (sent, _) in self._in_flight.items() if now - sent > self.deadline]
+            for request_id in expired:
+                del self._in_flight[request_id]
+        if expired:
+            logger.warning(f"{len(expired)} remote requests went over the {self.deadline}s deadline, running locally")
+            self._backoff_until = now + self.retry_interval
+
+    def _receive_loop(self, sock: socket.socket):
+        try:
+            while True:
+                request_id, boxes, confidences, class_ids, inference_ms = recv_detections(sock)
+                with self._in_flight_lock:
+                    pending = self._in_flight.pop(request_id, None)
+                if pending is None:
+                    # Already abandoned after going over the deadline
+                    continue
+                sent, context = pending
+                self.last_round_trip = time.monotonic() - sent
+                round_trip_ns = int(self.last_round_trip * 1e9)
+                tracer.add_span("remote_round_trip", tracer.now() - round_trip_ns, round_trip_ns, request_id=request_id)
+                speed = {"inference": inference_ms, "round_trip": self.last_round_trip * 1000}
+                self._completed.put(RemoteResult(context, boxes, confidences, class_ids, speed))
+        except (ConnectionError, OSError) as e:
+            if self._sock is sock:
+                self._disconnect(f"receive failed: {e}")
+
+
+if __name__ == "__main__":
+    model_path = sys.argv[1] if len(sys.argv) > 1 else ".models/yolo11n.pt"
+    host = sys.argv[2] if len(sys.argv) > 2 else "0.0.0.0"
+    port = int(sys.argv[3]) if len(sys.argv) > 3 else 5555
+    InferenceServer(model_path, host, port).serve_forever()
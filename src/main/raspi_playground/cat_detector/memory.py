@@ -0,0 +1,86 @@
+"""
+Resident memory (RSS) accounting by component, to see where the memory goes on 1-2 GB boards.
+
+`MemoryReport.measure(component)` records how much the process RSS grew while a component was set
+up (e.g. loading the model or starting the camera), and `set_size` records the size of known
+buffers directly. `log()` reports every component, the RSS they don't account for and how much the
+RSS has grown since the report was created; `maybe_log()` does so at most every `interval` seconds.
+"""
+from contextlib import contextmanager
+import gc
+import os
+import resource
+import time
+from typing import Dict
+
+import logging
+
+logging.basicConfig(level=logging.INFO)
+
+logger = logging.getLogger(__name__)
+
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+def rss_bytes() -> int:
+    """
+    Current resident set size of this process. Falls back to the peak RSS where /proc isn't available.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except OSError:
+        # ru_maxrss is in kilobytes on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def format_mb(size: int) -> str:
+    return f"{size / 2**20:.1f}MB"
+
+
+class MemoryReport:
+    """
+    RSS broken down by component. The RSS when the report is created is counted as "startup",
+    which covers the interpreter and the imported libraries (OpenCV, NumPy, picamera2, ...).
+    torch and ultralytics are only imported with the ultralytics backend, as part of "model".
+    """
+
+    def __init__(self, interval: float = 300.0):
+        self.interval = interval
+        self.startup_rss = rss_bytes()
+        self.components: Dict[str, int] = {"startup": self.startup_rss}
+        self._last_log = time.monotonic()
+
+    @contextmanager
+    def measure(self, component: str):
+        """
+        Add the RSS growth while the block runs to `component`.
+        """
+        gc.collect()
+        before = rss_bytes()
+        try:
+            yield
+        finally:
+            gc.collect()
+            self.components[component] = self.components.get(component, 0) + rss_bytes() - before
+
+    def set_size(self, component: str, size: int):
+        """
+        Set the size of `component` in bytes, e.g. from the `nbytes` of its buffers.
+        """
+        self.components[component] = size
+
+    def log(self, label: str = "Memory"):
+        rss = rss_bytes()
+        components = ", ".join(f"{name} {format_mb(size)}" for name, size in self.components.items())
+        other = rss - sum(self.components.values())
+        logger.info(
+            f"{label}: RSS {format_mb(rss)} ({components}, other {format_mb(other)}), "
+            f"{format_mb(rss - self.startup_rss)} since startup"
+        )
+        self._last_log = time.monotonic()
+
+    def maybe_log(self):
+        if self.interval and time.monotonic() - self._last_log >= self.interval:
+            self.log()
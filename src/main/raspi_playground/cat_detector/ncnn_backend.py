@@ -0,0 +1,185 @@
+"""
+A lean YOLO inference backend which runs an exported `.models/*_ncnn_model` directly with `ncnn`.
+
+It skips ultralytics' `Results`/`Boxes` objects, torch tensors and generic postprocessing: the
+input is letterboxed with `preprocessing.Letterbox`, the raw output is decoded in NumPy and
+filtered with a class-aware NMS, and the detections come back as plain arrays.
+
+Run this file directly to compare it against ultralytics on a directory of reference images:
+    uv run src/main/raspi_playground/cat_detector/ncnn_backend.py .models/yolo11n_ncnn_model path/to/images/
+"""
+import os
+import sys
+import time
+from typing import Dict, Tuple
+import cv2
+import numpy as np
+import yaml
+
+from preprocessing import Letterbox
+
+import logging
+
+logging.basicConfig(level=logging.INFO)
+
+logger = logging.getLogger(__name__)
+
+
+# Same defaults as ultralytics' predict()
+CONF_THRESHOLD = 0.25
+IOU_THRESHOLD = 0.7
+MAX_DETECTIONS = 300
+# Offset boxes of different classes by this much so a single NMS pass never suppresses across classes
+MAX_WH = 7680
+
+
+def non_max_suppression(
+    boxes: np.ndarray, scores: np.ndarray, class_ids: np.ndarray, iou_threshold: float = IOU_THRESHOLD
+) -> np.ndarray:
+    """
+    Class-aware greedy NMS on (N, 4) xyxy boxes. Returns the indices to keep, by descending score.
+    Each step suppresses every remaining overlapping box at once, so it loops once per kept box.
+    """
+    offset_boxes = boxes + (class_ids * MAX_WH)[:, None]
+    x1, y1, x2, y2 = offset_boxes.T
+    areas = (x2 - x1) * (y2 - y1)
+
+    order = np.argsort(-scores, kind="stable")
+    keep = []
+    while order.size > 0:
+        best, rest = order[0], order[1:]
+        keep.append(best)
+        width = np.clip(np.minimum(x2[best], x2[rest]) - np.maximum(x1[best], x1[rest]), 0, None)
+        height = np.clip(np.minimum(y2[best], y2[rest]) - np.maximum(y1[best], y1[rest]), 0, None)
+        intersection = width * height
+        iou = intersection / (areas[best] + areas[rest] - intersection + 1e-9)
+        order = rest[iou <= iou_threshold]
+    return np.array(keep, dtype=np.int64)
+
+
+class NcnnDetector:
+    """
+    Run an ultralytics NCNN export (`model.ncnn.param`, `model.ncnn.bin`, `metadata.yaml`) with ncnn.
+    """
+
+    names: Dict[int, str]
+    imgsz: int
+
+    def __init__(
+        self,
+        model_dir: str,
+        conf_threshold: float = CONF_THRESHOLD,
+        iou_threshold: float = IOU_THRESHOLD,
+        max_detections: int = MAX_DETECTIONS,
+        num_threads: int = 4,
+        low_memory: bool = False,
+    ):
+        # Only imported here, so the NMS and postprocessing can be used without ncnn installed
+        import ncnn
+
+        self.conf_threshold = conf_threshold
+        self.iou_threshold = iou_threshold
+        self.max_detections = max_detections
+
+        with open(os.path.join(model_dir, "metadata.yaml")) as f:
+            metadata = yaml.safe_load(f)
+        self.names = {int(class_id): name for class_id, name in metadata["names"].items()}
+        imgsz = metadata.get("imgsz", 640)
+        self.imgsz = imgsz[0] if isinstance(imgsz, (list, tuple)) else int(imgsz)
+
+        self._ncnn = ncnn
+        self.net = ncnn.Net()
+        self.net.opt.use_vulkan_compute = False
+        self.net.opt.num_threads = num_threads
+        if low_memory:
+            # Winograd and sgemm convolutions keep transformed copies of the weights, several times their size
+            self.net.opt.use_winograd_convolution = False
+            self.net.opt.use_sgemm_convolution = False
+            # Free intermediate blobs as soon as the next layer has used them
+            self.net.opt.lightmode = True
+        self.net.load_param(os.path.join(model_dir, "model.ncnn.param"))
+        self.net.load_model(os.path.join(model_dir, "model.ncnn.bin"))
+        self.input_name = self.net.input_names()[0]
+        self.output_name = sorted(self.net.output_names())[0]
+
+    def detect(self, model_input: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, Dict[str, float]]:
+        """
+        Run the model on a letterboxed (1, 3, imgsz, imgsz) float32 input.
+        Returns (boxes, confidences, class_ids, speed) with xyxy boxes in input coordinates
+        and the inference / postprocess times in milliseconds.
+        """
+        start = time.perf_counter()
+        extractor = self.net.create_extractor()
+        extractor.input(self.input_name, self._ncnn.Mat(model_input[0]))
+        _, output = extractor.extract(self.output_name)
+        # (4 + num_classes, num_anchors): cx, cy, w, h then one score per class
+        predictions = np.array(output)
+        inference_done = time.perf_counter()
+
+        boxes, confidences, class_ids = self.postprocess(predictions)
+        speed = {
+            "inference": (inference_done - start) * 1000,
+            "postprocess": (time.perf_counter() - inference_done) * 1000,
+        }
+        return boxes, confidences, class_ids, speed
+
+    def postprocess(self, predictions: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Decode raw (4 + num_classes, num_anchors) predictions into NMS-filtered xyxy boxes.
+        """
+        scores = predictions[4:]
+        class_ids = scores.argmax(axis=0)
+        confidences = scores[class_ids, np.arange(scores.shape[1])]
+
+        candidates = confidences > self.conf_threshold
+        cx, cy, w, h = predictions[:4, candidates]
+        boxes = np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1).astype(np.float32)
+        confidences = confidences[candidates].astype(np.float32)
+        class_ids = class_ids[candidates]
+
+        keep = non_max_suppression(boxes, confidences, class_ids, self.iou_threshold)[: self.max_detections]
+        return boxes[keep], confidences[keep], class_ids[keep].astype(np.int64)
+
+
+def compare_with_ultralytics(model_dir: str, images_dir: str, tolerance: float = 2.0) -> bool:
+    """
+    Run both backends on every image in `images_dir` and check that they find the same boxes,
+    with corners within `tolerance` pixels. Returns True if every image matches.
+    """
+    from ultralytics import YOLO
+
+    detector = NcnnDetector(model_dir)
+    reference = YOLO(model_dir, task="detect")
+
+    all_match = True
+    for file_name in sorted(os.listdir(images_dir)):
+        image = cv2.imread(os.path.join(images_dir, file_name))
+        if image is None:
+            continue
+
+        letterbox = Letterbox(image.shape, imgsz=detector.imgsz)
+        boxes, confidences, class_ids, _ = detector.detect(letterbox(image))
+        letterbox.scale_boxes(boxes)
+
+        expected = reference.predict(image, imgsz=detector.imgsz, verbose=False)[0].boxes
+        expected_boxes = expected.xyxy.cpu().numpy()
+        expected_class_ids = expected.cls.cpu().numpy().astype(np.int64)
+
+        # Both backends order detections by confidence, so matching rows should line up
+        if len(boxes) != len(expected_boxes) or not np.array_equal(class_ids, expected_class_ids):
+            logger.warning(f"{file_name}: {len(boxes)} detections, expected {len(expected_boxes)}")
+            all_match = False
+            continue
+
+        error = float(np.abs(boxes - expected_boxes).max()) if len(boxes) else 0.0
+        if error > tolerance:
+            logger.warning(f"{file_name}: boxes differ by up to {error:.2f}px")
+            all_match = False
+        else:
+            logger.info(f"{file_name}: {len(boxes)} detections match (max error {error:.2f}px)")
+
+    return all_match
+
+
+if __name__ == "__main__":
+    sys.exit(0 if compare_with_ultralytics(sys.argv[1], sys.argv[2]) else 1)
@@ -0,0 +1,127 @@
+"""
+Allocation-free frame preprocessing for the detection engine.
+
+`Letterbox` resizes and pads a camera frame straight into a preallocated NCHW float32 input
+buffer, and `FramePool` keeps a small ring of preallocated frames to hand to subscribers.
+After the first frame neither allocates anything, so steady-state capture + preprocessing
+does no per-frame allocation.
+"""
+from typing import List, Optional, Tuple
+import cv2
+import numpy as np
+
+
+class Letterbox:
+    """
+    Letterbox frames of a fixed shape into a square `imgsz` x `imgsz` model input.
+
+    Matches ultralytics' letterboxing: keep the aspect ratio, scale with bilinear interpolation,
+    center the image and pad with gray (114). The result is RGB, CHW, float32 in [0, 1].
+    """
+
+    def __init__(self, frame_shape: Tuple[int, ...], imgsz: int = 640, pad_value: int = 114):
+        height, width = frame_shape[:2]
+        if len(frame_shape) != 3 or frame_shape[2] != 3:
+            raise ValueError(f"Expected a 3 channel frame, got shape {frame_shape}")
+
+        self.frame_shape = tuple(frame_shape)
+        self.imgsz = imgsz
+        self.scale = min(imgsz / height, imgsz / width)
+        self.new_width = int(round(width * self.scale))
+        self.new_height = int(round(height * self.scale))
+        self.pad_x = (imgsz - self.new_width) // 2
+        self.pad_y = (imgsz - self.new_height) // 2
+
+        # OpenCV copies non-contiguous inputs (like the [:, :, :3] view of a camera buffer) into a new array,
+        # so those are first copied into this buffer instead, allocated on the first such frame
+        self._source: Optional[np.ndarray] = None
+
+        self._canvas = np.full((imgsz, imgsz, 3), pad_value, dtype=np.uint8)
+        self._canvas_view = self._canvas[
+            self.pad_y : self.pad_y + self.new_height, self.pad_x : self.pad_x + self.new_width
+        ]
+        # Horizontal padding makes the destination rows non-contiguous, so resize into a scratch buffer instead
+        if self._canvas_view.flags.c_contiguous:
+            self._resized = self._canvas_view
+        else:
+            self._resized = np.empty((self.new_height, self.new_width, 3), dtype=np.uint8)
+
+        # BGR HWC -> RGB CHW as a view, so the conversion to float is a single pass with no temporaries
+        self._rgb_chw = self._canvas[:, :, ::-1].transpose(2, 0, 1)
+        self.input = np.empty((1, 3, imgsz, imgsz), dtype=np.float32)
+        self._box_offset = np.array([self.pad_x, self.pad_y, self.pad_x, self.pad_y], dtype=np.float32)
+
+    def __call__(self, frame: np.ndarray) -> np.ndarray:
+        """
+        Letterbox a BGR frame into the input buffer and return it.
+        The returned array is reused by the next call.
+        """
+        if frame.shape != self.frame_shape:
+            raise ValueError(f"Expected a frame of shape {self.frame_shape}, got {frame.shape}")
+
+        if self.scale == 1:
+            np.copyto(self._resized, frame)
+        else:
+            if not frame.flags.c_contiguous:
+                if self._source is None:
+                    self._source = np.empty(self.frame_shape, dtype=np.uint8)
+                np.copyto(self._source, frame)
+                frame = self._source
+            resized = cv2.resize(
+                frame, (self.new_width, self.new_height), dst=self._resized, interpolation=cv2.INTER_LINEAR
+            )
+            # OpenCV only writes in place when it can use the buffer as-is
+            if resized is not self._resized:
+                np.copyto(self._resized, resized)
+        if self._resized is not self._canvas_view:
+            np.copyto(self._canvas_view, self._resized)
+
+        np.multiply(self._rgb_chw, np.float32(1 / 255), out=self.input[0], dtype=np.float32)
+        return self.input
+
+    @property
+    def canvas(self) -> np.ndarray:
+        """
+        The letterboxed BGR uint8 image of the last call, before normalisation. Reused by the next call.
+        """
+        return self._canvas
+
+    @property
+    def nbytes(self) -> int:
+        scratch = self._resized.nbytes if self._resized is not self._canvas_view else 0
+        source = self._source.nbytes if self._source is not None else 0
+        return self._canvas.nbytes + scratch + source + self.input.nbytes
+
+    def scale_boxes(self, boxes: np.ndarray) -> np.ndarray:
+        """
+        Map (N, 4) xyxy boxes from model input coordinates back to frame coordinates, in place.
+        """
+        boxes -= self._box_offset
+        boxes /= self.scale
+        height, width = self.frame_shape[:2]
+        np.clip(boxes[:, 0::2], 0, width, out=boxes[:, 0::2])
+        np.clip(boxes[:, 1::2], 0, height, out=boxes[:, 1::2])
+        return boxes
+
+
+class FramePool:
+    """
+    A ring of preallocated frames.
+
+    Each `copy` overwrites the oldest buffer, so a frame handed out stays valid for the next
+    `size - 1` copies. Consumers which hold on to frames for longer must copy them.
+    """
+
+    def __init__(self, frame_shape: Tuple[int, ...], size: int, dtype=np.uint8):
+        self._buffers: List[np.ndarray] = [np.empty(frame_shape, dtype=dtype) for _ in range(size)]
+        self._next = 0
+
+    @property
+    def nbytes(self) -> int:
+        return sum(buffer.nbytes for buffer in self._buffers)
+
+    def copy(self, frame: np.ndarray) -> np.ndarray:
+        buffer = self._buffers[self._next]
+        self._next = (self._next + 1) % len(self._buffers)
+        np.copyto(buffer, frame)
+        return buffer
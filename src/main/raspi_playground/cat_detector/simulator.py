@@ -0,0 +1,434 @@
+"""
+Hardware-in-the-loop simulator for the cat follower and buzzer.
+
+Runs the real `CatFollowerRunner` and `CatBuzzerRunner` on a `DetectionEngine`, but with:
+  - a simulated camera which renders a moving cat into each frame from the current pan/tilt pose,
+  - a fake PCA9685/ServoKit whose servos move towards their commanded angle at a limited slew rate,
+  - gpiozero's mock pin factory for the buzzer and RGB LED.
+
+By default the cat's ground-truth box stands in for the model, after a configurable inference latency,
+which benchmarks the control loop on any machine: it only needs NumPy, OpenCV and gpiozero, and never
+imports picamera2, adafruit_servokit, torch or ultralytics. Pass a cat picture as the sprite to run the
+real YOLO model (with ultralytics) on the rendered frames instead.
+
+Usage:
+    uv run src/main/raspi_playground/cat_detector/simulator.py [duration_seconds] [cat_sprite.png]
+"""
+from contextlib import nullcontext
+from dataclasses import dataclass
+import math
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+import cv2
+import numpy as np
+from gpiozero import Device
+from gpiozero.pins.mock import MockFactory, MockPWMPin
+
+from cat_buzzer import CatBuzzerRunner
+from cat_follower import CatFollowerRunner
+from detection_engine import DetectionEngine, Detections
+
+import logging
+
+logging.basicConfig(level=logging.INFO)
+
+logger = logging.getLogger(__name__)
+
+
+COCO_CAT_CLASS_ID = 15
+
+
+class SimulatedServo:
+    """
+    An SG90-like servo which moves towards its commanded angle at `slew_rate` degrees per second.
+    Mirrors the parts of adafruit_motor's `Servo` the runners use.
+    """
+
+    def __init__(self, slew_rate: float = 300.0, actuation_range: int = 180):
+        self.slew_rate = slew_rate
+        self.actuation_range = actuation_range
+        self.min_pulse, self.max_pulse = 750, 2250
+        self.commands = 0
+        self._target: Optional[float] = None
+        self._position = actuation_range / 2
+        self._last_update = time.monotonic()
+        self._lock = threading.Lock()
+
+    def set_pulse_width_range(self, min_pulse: int = 750, max_pulse: int = 2250):
+        self.min_pulse, self.max_pulse = min_pulse, max_pulse
+
+    @property
+    def angle(self) -> Optional[float]:
+        return self._target
+
+    @angle.setter
+    def angle(self, new_angle: Optional[float]):
+        if new_angle is not None and not 0 <= new_angle <= self.actuation_range:
+            raise ValueError("Angle out of range")
+        with self._lock:
+            self._advance()
+            self._target = new_angle
+            self.commands += 1
+
+    def position(self) -> float:
+        """
+        The physical angle of the servo horn right now.
+        """
+        with self._lock:
+            self._advance()
+            return self._position
+
+    def _advance(self):
+        now = time.monotonic()
+        if self._target is not None:
+            max_step = self.slew_rate * (now - self._last_update)
+            self._position += float(np.clip(self._target - self._position, -max_step, max_step))
+        self._last_update = now
+
+
+class SimulatedServoKit:
+    """
+    Stand-in for `adafruit_servokit.ServoKit` backed by `SimulatedServo`s.
+    """
+
+    def __init__(self, channels: int = 16, slew_rate: float = 300.0):
+        self.servo = [SimulatedServo(slew_rate) for _ in range(channels)]
+
+
+@dataclass
+class FrameTruth:
+    """
+    Where the camera was pointing and where the cat really was when a frame was rendered.
+    """
+
+    timestamp: float
+    view_az: float
+    view_el: float
+    cat_az: float
+    cat_el: float
+    # xyxy pixel box of the visible part of the cat, None if it's out of view
+    box: Optional[np.ndarray]
+
+    @property
+    def error(self) -> float:
+        """
+        Angle in degrees between the center of the view and the cat.
+        """
+        return math.hypot(self.cat_az - self.view_az, self.cat_el - self.view_el)
+
+
+class CatScene:
+    """
+    A cat walking a Lissajous path in front of the pan-tilt mount, in (azimuth, elevation) degrees.
+    """
+
+    def __init__(
+        self,
+        frame_size: Tuple[int, int] = (1280, 1280),
+        fov: Tuple[float, float] = (62.2, 48.8),
+        cat_size: Tuple[float, float] = (12.0, 9.0),
+        amplitude: Tuple[float, float] = (40.0, 12.0),
+        period: Tuple[float, float] = (20.0, 13.0),
+        sprite_path: Optional[str] = None,
+    ):
+        self.width, self.height = frame_size
+        self.fov = fov
+        self.amplitude = amplitude
+        self.period = period
+        self.pixels_per_degree = (self.width / fov[0], self.height / fov[1])
+        self.sprite_size = (int(cat_size[0] * self.pixels_per_degree[0]), int(cat_size[1] * self.pixels_per_degree[1]))
+        self.sprite, self.sprite_alpha = self._load_sprite(sprite_path)
+
+    def cat_position(self, t: float) -> Tuple[float, float]:
+        # Start a quarter period in, so the cat begins off to the side and has to be acquired
+        return (
+            self.amplitude[0] * math.sin(2 * math.pi * t / self.period[0] + math.pi / 2),
+            self.amplitude[1] * math.sin(2 * math.pi * t / self.period[1]),
+        )
+
+    def render(self, frame: np.ndarray, view_az: float, view_el: float, t: float) -> FrameTruth:
+        """
+        Draw the scene as seen from the given view direction into `frame`.
+        """
+        cat_az, cat_el = self.cat_position(t)
+        frame[:] = (90, 110, 100)
+        self._draw_grid(frame, view_az, view_el)
+
+        # Image y grows downwards while elevation grows upwards
+        center_x = self.width / 2 + (cat_az - view_az) * self.pixels_per_degree[0]
+        center_y = self.height / 2 - (cat_el - view_el) * self.pixels_per_degree[1]
+        box = self._paste_sprite(
+            frame, int(center_x - self.sprite_size[0] / 2), int(center_y - self.sprite_size[1] / 2)
+        )
+        return FrameTruth(t, view_az, view_el, cat_az, cat_el, box)
+
+    def _draw_grid(self, frame: np.ndarray, view_az: float, view_el: float, spacing: float = 10.0):
+        # A fixed grid in world angles, so camera motion is visible in the preview
+        first_az = math.ceil((view_az - self.fov[0] / 2) / spacing) * spacing
+        for az in np.arange(first_az, view_az + self.fov[0] / 2, spacing):
+            x = int(self.width / 2 + (az - view_az) * self.pixels_per_degree[0])
+            cv2.line(frame, (x, 0), (x, self.height - 1), (70, 90, 80), 2)
+        first_el = math.ceil((view_el - self.fov[1] / 2) / spacing) * spacing
+        for el in np.arange(first_el, view_el + self.fov[1] / 2, spacing):
+            y = int(self.height / 2 - (el - view_el) * self.pixels_per_degree[1])
+            cv2.line(frame, (0, y), (self.width - 1, y), (70, 90, 80), 2)
+
+    def _paste_sprite(self, frame: np.ndarray, left: int, top: int) -> Optional[np.ndarray]:
+        sprite_width, sprite_height = self.sprite_size
+        x1, y1 = max(left, 0), max(top, 0)
+        x2, y2 = min(left + sprite_width, self.width), min(top + sprite_height, self.height)
+        if x1 >= x2 or y1 >= y2:
+            return None
+
+        sprite = self.sprite[y1 - top : y2 - top, x1 - left : x2 - left]
+        alpha = self.sprite_alpha[y1 - top : y2 - top, x1 - left : x2 - left]
+        region = frame[y1:y2, x1:x2]
+        region[:] = (sprite * alpha + region * (1 - alpha)).astype(np.uint8)
+        return np.array([x1, y1, x2, y2], dtype=np.float32)
+
+    def _load_sprite(self, sprite_path: Optional[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Load and resize the sprite, returning (BGR float image, HxWx1 alpha in [0, 1]).
+        Without a sprite image, draw a cat silhouette: good enough for ground-truth runs, not for YOLO.
+        """
+        width, height = self.sprite_size
+        if sprite_path is not None:
+            image = cv2.imread(sprite_path, cv2.IMREAD_UNCHANGED)
+            if image is None:
+                raise FileNotFoundError(sprite_path)
+            image = cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+            if image.shape[2] == 4:
+                return image[:, :, :3].astype(np.float32), image[:, :, 3:].astype(np.float32) / 255
+            return image.astype(np.float32), np.ones((height, width, 1), dtype=np.float32)
+
+        mask = np.zeros((height, width), dtype=np.uint8)
+        cv2.ellipse(
+            mask, (int(width * 0.45), int(height * 0.65)), (int(width * 0.4), int(height * 0.3)), 0, 0, 360, 255, -1
+        )
+        head = (int(width * 0.8), int(height * 0.35))
+        cv2.circle(mask, head, int(height * 0.2), 255, -1)
+        for ear_x in (head[0] - int(height * 0.15), head[0] + int(height * 0.05)):
+            ear = np.array(
+                [
+                    [ear_x, head[1] - int(height * 0.1)],
+                    [ear_x + int(height * 0.1), head[1] - int(height * 0.1)],
+                    [ear_x + int(height * 0.05), 0],
+                ]
+            )
+            cv2.fillConvexPoly(mask, ear, 255)
+        sprite = np.full((height, width, 3), (40, 60, 80), dtype=np.float32)
+        return sprite, (mask[:, :, None] > 0).astype(np.float32)
+
+
+class SimulatedRequest:
+    """
+    Stand-in for a Picamera2 `CompletedRequest`, mapped by `SimulatedEngine.map_request`.
+    """
+
+    def __init__(self, array: np.ndarray):
+        self.array = array
+
+    def release(self):
+        pass
+
+
+class SimulatedCamera:
+    """
+    Stand-in for `Picamera2` which renders the scene from the pan/tilt servos' physical position.
+    Frames are paced to at most `fps`, and the ground truth of every frame is kept in `truths`.
+    """
+
+    def __init__(
+        self,
+        scene: CatScene,
+        pan_servo: SimulatedServo,
+        tilt_servo: SimulatedServo,
+        pan_center: float = 90.0,
+        tilt_center: float = 45.0,
+        fps: float = 30.0,
+    ):
+        self.scene = scene
+        self.pan_servo = pan_servo
+        self.tilt_servo = tilt_servo
+        self.pan_center = pan_center
+        self.tilt_center = tilt_center
+        self.frame_interval = 1 / fps
+        self.truths: List[FrameTruth] = []
+        self._frame = np.empty((scene.height, scene.width, 3), dtype=np.uint8)
+        self._start = time.monotonic()
+        self._last_capture = 0.0
+
+    @property
+    def last_truth(self) -> FrameTruth:
+        return self.truths[-1]
+
+    def configure(self, *args, **kwargs):
+        pass
+
+    def start(self):
+        self._start = time.monotonic()
+        self.truths = []
+
+    def stop(self):
+        pass
+
+    def capture_request(self) -> SimulatedRequest:
+        wait = self._last_capture + self.frame_interval - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        self._last_capture = time.monotonic()
+
+        # Decreasing the pan angle turns the camera right, increasing the tilt angle turns it up
+        view_az = self.pan_center - self.pan_servo.position()
+        view_el = self.tilt_servo.position() - self.tilt_center
+        self.truths.append(self.scene.render(self._frame, view_az, view_el, self._last_capture - self._start))
+        return SimulatedRequest(self._frame)
+
+
+class GroundTruthModel:
+    """
+    Used in place of the YOLO model: reports the cat's true box after `latency` seconds.
+    """
+
+    names: Dict[int, str] = {COCO_CAT_CLASS_ID: "cat"}
+
+    def __init__(self, latency: float = 0.1, confidence: float = 0.9):
+        self.latency = latency
+        self.confidence = confidence
+
+
+class SimulatedEngine(DetectionEngine):
+    """
+    A `DetectionEngine` running on a `SimulatedCamera`, with either the real model or a `GroundTruthModel`.
+    """
+
+    picam: SimulatedCamera
+
+    @staticmethod
+    def map_request(request: SimulatedRequest):
+        return nullcontext(request)
+
+    def predict(
+        self,
+        frame_id: int,
+        timestamp: float,
+        frame_shape: Tuple[int, ...],
+        frame: Optional[np.ndarray],
+        model_input: np.ndarray,
+    ) -> Detections:
+        if not isinstance(self.model, GroundTruthModel):
+            return super().predict(frame_id, timestamp, frame_shape, frame, model_input)
+
+        time.sleep(self.model.latency)
+        box = self.picam.last_truth.box
+        boxes = np.empty((0, 4), dtype=np.float32) if box is None else box[None]
+        return Detections(
+            frame_id=frame_id,
+            timestamp=timestamp,
+            frame_shape=frame_shape,
+            frame=frame,
+            boxes=boxes,
+            confidences=np.full(len(boxes), self.model.confidence, dtype=np.float32),
+            class_ids=np.full(len(boxes), COCO_CAT_CLASS_ID, dtype=np.int64),
+            names=self.model.names,
+            speed={"inference": self.model.latency * 1000},
+        )
+
+
+@dataclass
+class SimulationReport:
+    frames: int
+    fps: float
+    # Degrees between the view center and the cat, over the frames after it was acquired
+    mean_tracking_error: float
+    p95_tracking_error: float
+    # Seconds until the cat was first within `acquire_threshold` degrees of the view center, None if never
+    time_to_acquire: Optional[float]
+    buzzes: int
+    servo_commands: int
+
+    def __str__(self) -> str:
+        acquire = f"{self.time_to_acquire:.2f}s" if self.time_to_acquire is not None else "never"
+        return (
+            f"{self.frames} frames at {self.fps:.1f} FPS, acquired after {acquire}, "
+            f"tracking error mean {self.mean_tracking_error:.1f}° / p95 {self.p95_tracking_error:.1f}°, "
+            f"{self.buzzes} buzzes, {self.servo_commands} servo commands"
+        )
+
+
+class HardwareSimulator:
+    """
+    Wire the real runners up to the simulated camera, servos and GPIO pins, and benchmark them.
+    """
+
+    def __init__(
+        self,
+        scene: Optional[CatScene] = None,
+        use_model: bool = False,
+        model_latency: float = 0.1,
+        slew_rate: float = 300.0,
+        acquire_threshold: float = 5.0,
+        show_preview: bool = False,
+    ):
+        self.acquire_threshold = acquire_threshold
+        self.scene = scene if scene is not None else CatScene()
+
+        # The buzzer and RGB LED are created by the runner, on mock pins
+        Device.pin_factory = MockFactory(pin_class=MockPWMPin)
+
+        self.servos = SimulatedServoKit(slew_rate=slew_rate)
+        self.camera = SimulatedCamera(
+            self.scene,
+            self.servos.servo[CatFollowerRunner.PAN_CHANNEL],
+            self.servos.servo[CatFollowerRunner.TILT_CHANNEL],
+        )
+        model = None if use_model else GroundTruthModel(latency=model_latency)
+        self.engine = SimulatedEngine(camera=self.camera, model=model)
+        self.follower = self.engine.add_subscriber(CatFollowerRunner(servos=self.servos))
+        self.buzzer = self.engine.add_subscriber(CatBuzzerRunner())
+        if show_preview:
+            from detection_engine import PreviewSubscriber
+
+            self.engine.add_subscriber(PreviewSubscriber())
+
+    def run(self, duration: float = 30.0) -> SimulationReport:
+        timer = threading.Timer(duration, self.engine.stop)
+        timer.start()
+        try:
+            self.engine.main()
+        finally:
+            timer.cancel()
+        return self.report()
+
+    def report(self) -> SimulationReport:
+        truths = self.camera.truths
+        errors = np.array([truth.error for truth in truths])
+        elapsed = truths[-1].timestamp - truths[0].timestamp if len(truths) > 1 else 0.0
+
+        acquired = np.flatnonzero(errors < self.acquire_threshold)
+        time_to_acquire = truths[acquired[0]].timestamp if len(acquired) else None
+        tracking_errors = errors[acquired[0] :] if len(acquired) else errors
+
+        buzzer_states = self.buzzer.buzzer.pin.states
+        buzzes = sum(
+            1 for previous, state in zip(buzzer_states, buzzer_states[1:]) if state.state and not previous.state
+        )
+
+        return SimulationReport(
+            frames=len(truths),
+            fps=(len(truths) - 1) / elapsed if elapsed else 0.0,
+            mean_tracking_error=float(tracking_errors.mean()) if len(tracking_errors) else float("nan"),
+            p95_tracking_error=float(np.percentile(tracking_errors, 95)) if len(tracking_errors) else float("nan"),
+            time_to_acquire=time_to_acquire,
+            buzzes=buzzes,
+            servo_commands=sum(servo.commands for servo in self.servos.servo),
+        )
+
+
+if __name__ == "__main__":
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else 30.0
+    sprite_path = sys.argv[2] if len(sys.argv) > 2 else None
+    simulator = HardwareSimulator(CatScene(sprite_path=sprite_path), use_model=sprite_path is not None)
+    logger.info(f"Simulation finished: {simulator.run(duration)}")
@@ -0,0 +1,160 @@
+"""
+Per-frame trace timelines in the Chrome trace format, viewable in chrome://tracing or https://ui.perfetto.dev.
+
+Code is instrumented with the module level `tracer`:
+    with tracer.span("capture", frame_id=frame_id):
+        ...
+
+Spans are only recorded once `tracer.enable(path)` has been called; until then `span` returns a
+shared no-op context manager. Recorded spans go into a bounded in-memory buffer (the oldest are
+dropped first) from any thread, and are written to `path` on exit or when the process receives
+SIGUSR1, e.g. `kill -USR1 <pid>`.
+"""
+import atexit
+from collections import deque
+import json
+import os
+import signal
+import threading
+import time
+from typing import Deque, Dict, Optional
+
+import logging
+
+logging.basicConfig(level=logging.INFO)
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_MAX_EVENTS = 200_000
+# The order ultralytics (and the ncnn backend) run the stages reported in `speed`
+SPEED_STAGES = ("preprocess", "inference", "postprocess")
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    def __init__(self, tracer: "Tracer", name: str, args: Dict):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.tracer.add_span(self.name, self.start, time.perf_counter_ns() - self.start, **self.args)
+        return False
+
+
+class Tracer:
+    """
+    Collects complete ("X") events, one per span, in a ring buffer of at most `max_events`.
+    """
+
+    def __init__(self, max_events: int = DEFAULT_MAX_EVENTS):
+        self.enabled = False
+        self.path: Optional[str] = None
+        self._events: Deque[tuple] = deque(maxlen=max_events)
+        self._thread_names: Dict[int, str] = {}
+        self._start = time.perf_counter_ns()
+        self._dump_lock = threading.Lock()
+
+    def enable(self, path: str, max_events: int = DEFAULT_MAX_EVENTS, dump_signal: Optional[int] = signal.SIGUSR1):
+        """
+        Start recording spans, and dump them to `path` at exit and whenever `dump_signal` is received.
+        Must be called from the main thread if a `dump_signal` is given.
+        """
+        self.path = path
+        self._events = deque(maxlen=max_events)
+        self.enabled = True
+        atexit.register(self.dump)
+        if dump_signal is not None:
+            signal.signal(dump_signal, lambda signum, frame: self.dump())
+        logger.info(f"Tracing enabled, writing trace to {path} on exit or signal {dump_signal}")
+
+    def span(self, name: str, **args):
+        """
+        Return a context manager which records its duration as a span on the current thread.
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, args)
+
+    @staticmethod
+    def now() -> int:
+        return time.perf_counter_ns()
+
+    def add_span(self, name: str, start: int, duration: int, **args):
+        """
+        Record a span on the current thread from a `now()` start time and a duration in nanoseconds.
+        """
+        if not self.enabled:
+            return
+        thread_id = threading.get_native_id()
+        if thread_id not in self._thread_names:
+            self._thread_names[thread_id] = threading.current_thread().name
+        # deque.append is atomic, so any thread can record without a lock
+        self._events.append((name, start, duration, thread_id, args))
+
+    def add_speed_spans(self, start: int, speed: Dict[str, float], **args):
+        """
+        Record the stages of an ultralytics-style `speed` dict (in ms) as back to back spans from `start`.
+        """
+        for stage in SPEED_STAGES:
+            if stage in speed:
+                duration = int(speed[stage] * 1e6)
+                self.add_span(stage, start, duration, **args)
+                start += duration
+
+    def dump(self, path: Optional[str] = None):
+        """
+        Write the recorded spans to `path` (by default the path given to `enable`) as Chrome trace JSON.
+        """
+        path = path or self.path
+        if path is None:
+            return
+        # A signal can arrive while the main thread is already dumping, in which case that dump wins
+        if not self._dump_lock.acquire(blocking=False):
+            return
+        try:
+            pid = os.getpid()
+            trace_events = [
+                {"name": "thread_name", "ph": "M", "pid": pid, "tid": thread_id, "args": {"name": thread_name}}
+                for thread_id, thread_name in list(self._thread_names.items())
+            ]
+            for name, start, duration, thread_id, args in list(self._events):
+                trace_events.append(
+                    {
+                        "name": name,
+                        "ph": "X",
+                        "ts": (start - self._start) / 1000,
+                        "dur": duration / 1000,
+                        "pid": pid,
+                        "tid": thread_id,
+                        "args": args,
+                    }
+                )
+            with open(path, "w") as f:
+                json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, f, default=self._json_default)
+        finally:
+            self._dump_lock.release()
+        logger.info(f"Wrote {len(trace_events)} trace events to {path}")
+
+    @staticmethod
+    def _json_default(value):
+        # NumPy scalars in span args
+        return value.item() if hasattr(value, "item") else str(value)
+
+
+tracer = Tracer()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The cat detector modules import each other as siblings, the way they are when run as scripts
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src", "main", "raspi_playground", "cat_detector"))
@@ -0,0 +1,88 @@
+import os
+import time
+
+import pytest
+
+from config import ConfigWatcher, FollowerConfig, RuntimeConfig, load_config
+
+EXAMPLE_CONFIG = os.path.join(
+    os.path.dirname(__file__), "..", "src", "main", "raspi_playground", "cat_detector", "cat_detector.toml"
+)
+
+
+def write_config(tmp_path, text: str) -> str:
+    path = tmp_path / "cat_detector.toml"
+    path.write_text(text)
+    return str(path)
+
+
+def test_example_config_loads():
+    config = load_config(EXAMPLE_CONFIG)
+
+    assert config.model == "yolo11n"
+    assert [detection_class.name for detection_class in config.classes] == ["cat", "teddy bear", "person"]
+    assert config.follower == FollowerConfig()
+
+
+def test_missing_sections_stay_unset(tmp_path):
+    assert load_config(write_config(tmp_path, "")) == RuntimeConfig()
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "detection = 5",
+        "[detection]\nclasses = 5",
+        "[detection]\nclasses = [5]",
+        "buzzer = 5",
+        "led = 5",
+        "[led]\npins = 5",
+        "camera = 5",
+        '[camera]\nsize = "big"',
+        "[camera]\ncontrols = 5",
+        "follower = 5",
+        "[follower]\nclasses = 5",
+        "[follower]\npan = 3",
+        "[buzzer]\nunknown = 1",
+        '[led]\nidle_color = "not a color"',
+    ],
+)
+def test_wrongly_typed_sections_raise_value_error(tmp_path, text):
+    with pytest.raises(ValueError):
+        load_config(write_config(tmp_path, text))
+
+
+def test_watcher_keeps_reloading_after_a_bad_save(tmp_path):
+    path = write_config(tmp_path, "[buzzer]\nduration = 0.1")
+    watcher = ConfigWatcher(path, debounce=0.01, poll_interval=0.05)
+    watcher.start()
+    try:
+        write_config(tmp_path, "[follower]\npan = 3")
+        time.sleep(0.5)
+        assert watcher.config.buzzer.duration == 0.1
+
+        write_config(tmp_path, "[buzzer]\nduration = 0.3")
+        deadline = time.monotonic() + 5
+        while watcher.config.buzzer.duration != 0.3 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert watcher.config.buzzer.duration == 0.3
+    finally:
+        watcher.stop()
+
+
+def test_watcher_survives_unexpected_errors(tmp_path, monkeypatch):
+    import config
+
+    path = write_config(tmp_path, "[buzzer]\nduration = 0.1")
+    watcher = ConfigWatcher(path)
+
+    def broken_load_config(path):
+        raise AttributeError("unexpected")
+
+    monkeypatch.setattr(config, "load_config", broken_load_config)
+    watcher._safe_reload()
+    monkeypatch.undo()
+
+    write_config(tmp_path, "[buzzer]\nduration = 0.3")
+    watcher._safe_reload()
+    assert watcher.config.buzzer.duration == 0.3
@@ -0,0 +1,189 @@
+import socket
+import time
+from types import SimpleNamespace
+from typing import Tuple
+
+import numpy as np
+import pytest
+
+from inference_server import (
+    CLIENT_HELLO,
+    ENCODING_JPEG,
+    ENCODING_RAW,
+    ENCODING_ZLIB,
+    ENCODINGS,
+    HELLO_HEADER,
+    REQUEST_HEADER,
+    InferenceServer,
+    RemoteDetector,
+    decode_frame,
+    encode_frame,
+    recv_detections,
+    recv_exactly,
+)
+
+
+class _Tensor:
+    def __init__(self, values):
+        self.values = np.asarray(values, dtype=np.float32)
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self.values
+
+
+class StubModel:
+    """
+    Stands in for a YOLO model: finds one "cat" covering each frame, after `delay` seconds per batch.
+    """
+
+    names = {0: "person", 15: "cat"}
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.frames = []
+
+    def predict(self, frames, verbose=False):
+        time.sleep(self.delay)
+        self.frames.extend(frames)
+        results = []
+        for frame in frames:
+            height, width = frame.shape[:2]
+            boxes = SimpleNamespace(xyxy=_Tensor([[0, 0, width, height]]), conf=_Tensor([0.9]), cls=_Tensor([15]))
+            results.append(SimpleNamespace(boxes=boxes, speed={"inference": 1.5}))
+        return results
+
+
+def wait_for(predicate, timeout: float = 2.0):
+    end = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > end:
+            raise AssertionError("Timed out")
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def serve():
+    servers, clients = [], []
+
+    def serve(model: StubModel, max_batch: int = 8, **client_kwargs) -> Tuple[InferenceServer, RemoteDetector]:
+        server = InferenceServer(host="127.0.0.1", port=0, max_batch=max_batch, model=model)
+        server.start()
+        servers.append(server)
+        client = RemoteDetector("127.0.0.1", server.address[1], **client_kwargs)
+        clients.append(client)
+        return server, client
+
+    yield serve
+    for client in clients:
+        client.close()
+    for server in servers:
+        server.stop()
+
+
+def make_frame(height: int = 48, width: int = 64) -> np.ndarray:
+    # Smooth, so JPEG keeps it close to the original
+    frame = np.zeros((height, width, 3), dtype=np.uint8)
+    frame[:, :, 0] = np.linspace(0, 255, width, dtype=np.uint8)
+    frame[:, :, 1] = np.linspace(0, 255, height, dtype=np.uint8)[:, None]
+    return frame
+
+
+@pytest.mark.parametrize("encoding", list(ENCODINGS))
+def test_round_trip(serve, encoding):
+    model = StubModel()
+    _, client = serve(model, encoding=encoding)
+    frame = make_frame()
+
+    assert client.available()
+    assert client.names == model.names
+    client.submit(frame, context="frame 1")
+    wait_for(lambda: not client._completed.empty())
+
+    (result,) = client.completed()
+    assert result.context == "frame 1"
+    np.testing.assert_array_equal(result.boxes, [[0, 0, 64, 48]])
+    np.testing.assert_array_equal(result.class_ids, [15])
+    assert result.speed["inference"] == pytest.approx(1.5)
+    if encoding == "jpeg":
+        assert np.abs(model.frames[0].astype(int) - frame).mean() < 4
+    else:
+        np.testing.assert_array_equal(model.frames[0], frame)
+
+
+@pytest.mark.parametrize("encoding", [ENCODING_RAW, ENCODING_ZLIB, ENCODING_JPEG])
+def test_decode_frame_reverses_encode_frame(encoding):
+    frame = np.zeros((16, 24, 3), dtype=np.uint8)
+    frame[4:12, 8:16] = 200
+
+    decoded = decode_frame(encode_frame(frame, encoding), encoding, 16, 24)
+
+    assert decoded.shape == frame.shape
+    assert np.abs(decoded.astype(int) - frame).max() < 16
+
+
+@pytest.mark.parametrize(
+    "payload, encoding",
+    [
+        (b"not a jpeg", ENCODING_JPEG),
+        (b"not zlib", ENCODING_ZLIB),
+        (b"\0" * 10, ENCODING_RAW),
+        (b"\0" * 16 * 24 * 3, 7),
+    ],
+)
+def test_decode_frame_rejects_bad_payloads(payload, encoding):
+    with pytest.raises(ValueError):
+        decode_frame(payload, encoding, 16, 24)
+
+
+def test_server_skips_bad_payloads_and_keeps_serving(serve):
+    model = StubModel()
+    _, client = serve(model)
+    sock = socket.create_connection(client.address)
+    try:
+        (length,) = HELLO_HEADER.unpack(recv_exactly(sock, HELLO_HEADER.size))
+        recv_exactly(sock, length)
+        sock.sendall(CLIENT_HELLO.pack(1.0))
+        sock.sendall(REQUEST_HEADER.pack(1, ENCODING_JPEG, 16, 24, 5) + b"xxxxx")
+        sock.sendall(REQUEST_HEADER.pack(2, ENCODING_RAW, 16, 24, 5) + b"xxxxx")
+        payload = encode_frame(make_frame(16, 24), ENCODING_RAW)
+        sock.sendall(REQUEST_HEADER.pack(3, ENCODING_RAW, 16, 24, len(payload)) + payload)
+
+        request_id, boxes, _, _, _ = recv_detections(sock)
+    finally:
+        sock.close()
+
+    assert request_id == 3
+    np.testing.assert_array_equal(boxes, [[0, 0, 24, 16]])
+    assert len(model.frames) == 1
+
+
+def test_slow_server_falls_back_to_local(serve):
+    model = StubModel(delay=0.3)
+    _, client = serve(model, deadline=0.1, max_in_flight=3, retry_interval=60.0)
+
+    assert client.available()
+    for request_id in range(3):
+        client.submit(make_frame(), context=request_id)
+    time.sleep(0.15)
+
+    # Over the deadline: the requests are abandoned and the engine should run locally
+    assert not client.available()
+    assert client.can_submit()
+    time.sleep(0.4)
+    assert client.completed() == []
+
+
+def test_server_drops_requests_older_than_the_client_deadline(serve):
+    model = StubModel(delay=0.2)
+    server, client = serve(model, max_batch=1, deadline=0.1, max_in_flight=3)
+
+    assert client.available()
+    for request_id in range(3):
+        client.submit(make_frame(), context=request_id)
+
+    # The first request is served, the ones queued behind it go stale while it runs
+    wait_for(lambda: len(model.frames) + server.dropped == 3)
+    assert server.dropped >= 1
@@ -0,0 +1,40 @@
+import numpy as np
+
+from memory import MemoryReport, rss_bytes
+from preprocessing import FramePool, Letterbox
+
+# The engine's default 1280x1280 camera frames, seen through a [:, :, :3] view of the 4 channel buffer
+CAMERA_SHAPE = (1280, 1280, 4)
+FRAME_SHAPE = (1280, 1280, 3)
+# cat_monitor.py's five subscribers, plus the two frames the engine fills while they hold theirs
+POOL_SIZE = 5 + 2
+MB = 2**20
+# What the frame buffers may add to the detector's RSS on a 1 GB board
+FRAME_BUFFERS_CEILING = 64 * MB
+# RSS growth allowed over many frames once the buffers exist, i.e. no leak
+STEADY_STATE_CEILING = 2 * MB
+
+
+def test_frame_buffers_stay_under_memory_ceiling():
+    camera_buffer = np.random.default_rng(0).integers(0, 255, CAMERA_SHAPE, dtype=np.uint8)
+    frame = camera_buffer[:, :, :3]
+    report = MemoryReport(interval=0)
+
+    with report.measure("frame buffers"):
+        letterbox = Letterbox(FRAME_SHAPE)
+        pool = FramePool(FRAME_SHAPE, size=POOL_SIZE)
+        # Touch every buffer, untouched pages aren't resident yet
+        for _ in range(POOL_SIZE):
+            letterbox(frame)
+            pool.copy(frame)
+    report.set_size("letterbox", letterbox.nbytes)
+    report.set_size("frame pool", pool.nbytes)
+
+    assert report.components["frame buffers"] < FRAME_BUFFERS_CEILING
+    assert letterbox.nbytes + pool.nbytes < FRAME_BUFFERS_CEILING
+
+    steady_state_rss = rss_bytes()
+    for _ in range(200):
+        letterbox(frame)
+        pool.copy(frame)
+    assert rss_bytes() - steady_state_rss < STEADY_STATE_CEILING
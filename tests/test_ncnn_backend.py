@@ -0,0 +1,101 @@
+import numpy as np
+import pytest
+
+from ncnn_backend import NcnnDetector, non_max_suppression
+
+
+def iou(a: np.ndarray, b: np.ndarray) -> float:
+    width = max(0.0, min(a[2], b[2]) - max(a[0], b[0]))
+    height = max(0.0, min(a[3], b[3]) - max(a[1], b[1]))
+    intersection = width * height
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - intersection
+    return intersection / union
+
+
+def brute_force_nms(boxes: np.ndarray, scores: np.ndarray, class_ids: np.ndarray, iou_threshold: float) -> list:
+    """
+    Keep each box, best first, unless a kept box of the same class overlaps it by more than `iou_threshold`.
+    """
+    keep = []
+    for index in np.argsort(-scores, kind="stable"):
+        if all(class_ids[kept] != class_ids[index] or iou(boxes[kept], boxes[index]) <= iou_threshold for kept in keep):
+            keep.append(index)
+    return keep
+
+
+def random_boxes(rng: np.random.Generator, count: int):
+    # Clustered in a small area, so plenty of them overlap
+    corners = rng.uniform(0, 100, (count, 2))
+    sizes = rng.uniform(10, 60, (count, 2))
+    boxes = np.concatenate([corners, corners + sizes], axis=1)
+    return boxes, rng.uniform(0, 1, count), rng.integers(0, 3, count)
+
+
+@pytest.mark.parametrize("seed", range(10))
+@pytest.mark.parametrize("iou_threshold", [0.3, 0.7])
+def test_nms_matches_brute_force(seed, iou_threshold):
+    boxes, scores, class_ids = random_boxes(np.random.default_rng(seed), 60)
+
+    keep = non_max_suppression(boxes, scores, class_ids, iou_threshold)
+
+    assert keep.tolist() == brute_force_nms(boxes, scores, class_ids, iou_threshold)
+
+
+def test_nms_never_suppresses_across_classes():
+    boxes = np.array([[0, 0, 10, 10], [0, 0, 10, 10], [0, 0, 10, 10]], dtype=np.float32)
+    scores = np.array([0.9, 0.8, 0.7], dtype=np.float32)
+
+    assert non_max_suppression(boxes, scores, np.array([0, 1, 0])).tolist() == [0, 1]
+
+
+def make_detector(conf_threshold: float = 0.25, max_detections: int = 300) -> NcnnDetector:
+    # Skips loading a model, postprocess only needs the thresholds
+    detector = NcnnDetector.__new__(NcnnDetector)
+    detector.conf_threshold = conf_threshold
+    detector.iou_threshold = 0.7
+    detector.max_detections = max_detections
+    return detector
+
+
+def make_predictions(boxes_cxcywh: np.ndarray, class_scores: np.ndarray) -> np.ndarray:
+    """
+    Raw (4 + num_classes, num_anchors) model output for one anchor per row of the arguments.
+    """
+    return np.concatenate([boxes_cxcywh, class_scores], axis=1).T.astype(np.float32)
+
+
+def test_postprocess_decodes_boxes_and_classes():
+    predictions = make_predictions(
+        np.array([[50, 50, 20, 10], [200, 100, 40, 40], [50, 50, 20, 10]]),
+        np.array([[0.1, 0.9], [0.8, 0.2], [0.1, 0.2]]),
+    )
+
+    boxes, confidences, class_ids = make_detector().postprocess(predictions)
+
+    np.testing.assert_allclose(boxes, [[40, 45, 60, 55], [180, 80, 220, 120]])
+    np.testing.assert_allclose(confidences, [0.9, 0.8])
+    assert class_ids.tolist() == [1, 0]
+
+
+def test_postprocess_without_candidates():
+    predictions = make_predictions(np.array([[50, 50, 20, 10], [80, 80, 5, 5]]), np.array([[0.1, 0.2], [0.0, 0.1]]))
+
+    boxes, confidences, class_ids = make_detector().postprocess(predictions)
+
+    assert boxes.shape == (0, 4)
+    assert confidences.shape == (0,)
+    assert class_ids.shape == (0,)
+    assert class_ids.dtype == np.int64
+
+
+def test_postprocess_keeps_at_most_max_detections():
+    count = 20
+    # Far apart, so NMS keeps every one of them
+    centers = np.arange(count, dtype=np.float32)[:, None] * 100 + 50
+    boxes = np.concatenate([centers, centers, np.full((count, 2), 10)], axis=1)
+    scores = np.linspace(0.3, 0.95, count)[:, None]
+
+    boxes, confidences, class_ids = make_detector(max_detections=5).postprocess(make_predictions(boxes, scores))
+
+    assert len(boxes) == len(confidences) == len(class_ids) == 5
+    np.testing.assert_allclose(confidences, np.sort(scores[:, 0])[::-1][:5], rtol=1e-6)
@@ -0,0 +1,62 @@
+import tracemalloc
+
+import numpy as np
+import pytest
+
+from preprocessing import FramePool, Letterbox
+
+FRAMES = 50
+# A few hundred bytes of bookkeeping may stay allocated, nothing may grow per frame
+MAX_RETAINED = 4096
+# NumPy's ufunc casting buffer (8192 elements) comes and goes, a frame or model input would be megabytes
+MAX_PEAK = 64 * 1024
+
+
+def assert_no_per_frame_allocations(step, frames: int = FRAMES):
+    """
+    Run `step` for `frames` frames once warmed up, and check it neither keeps nor temporarily allocates buffers.
+    """
+    step()
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        for _ in range(frames):
+            step()
+        after, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert after - before < MAX_RETAINED
+    assert peak - before < MAX_PEAK
+
+
+@pytest.mark.parametrize("frame_shape", [(720, 1280, 3), (1280, 720, 3), (640, 640, 3), (1280, 1280, 3)])
+def test_letterbox_does_not_allocate_per_frame(frame_shape):
+    frame = np.random.default_rng(0).integers(0, 255, frame_shape, dtype=np.uint8)
+    letterbox = Letterbox(frame_shape)
+
+    assert_no_per_frame_allocations(lambda: letterbox(frame))
+
+
+def test_letterbox_accepts_camera_buffer_views():
+    # Picamera2's RGB888 buffers are mapped with a padded 4th channel, the engine passes a [:, :, :3] view
+    buffer = np.zeros((720, 1280, 4), dtype=np.uint8)
+    letterbox = Letterbox((720, 1280, 3))
+
+    assert_no_per_frame_allocations(lambda: letterbox(buffer[:, :, :3]))
+
+
+def test_frame_pool_does_not_allocate_per_frame():
+    frame = np.zeros((720, 1280, 3), dtype=np.uint8)
+    pool = FramePool(frame.shape, size=4)
+
+    assert_no_per_frame_allocations(lambda: pool.copy(frame))
+
+
+def test_letterbox_scale_boxes_maps_back_to_frame():
+    letterbox = Letterbox((720, 1280, 3))
+    boxes = np.array([[0, 140, 640, 500]], dtype=np.float32)
+
+    letterbox.scale_boxes(boxes)
+
+    np.testing.assert_allclose(boxes, [[0, 0, 1280, 720]], atol=1)